@@ -10,16 +10,18 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 import os
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
-from channels.auth import AuthMiddlewareStack
-from store.routing import websocket_urlpatterns
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'delivery_app.settings')
+django_asgi_app = get_asgi_application()
+
+from store.middleware import JWTAuthMiddlewareStack
+from store.routing import websocket_urlpatterns
 
 application = ProtocolTypeRouter(
     {
-        'http': get_asgi_application(),
-        'websocket': AuthMiddlewareStack(
+        'http': django_asgi_app,
+        'websocket': JWTAuthMiddlewareStack(
             URLRouter(
                 websocket_urlpatterns
         )
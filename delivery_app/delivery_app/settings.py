@@ -85,15 +85,33 @@ TEMPLATES = [
 ]
 ASGI_APPLICATION = 'delivery_app.asgi.application'
 WSGI_APPLICATION = 'delivery_app.wsgi.application'
-CHANNEL_LAYERS = {
-    "default": {
+CHANNEL_LAYER_BACKENDS = {
+    'redis': {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [("127.0.0.1", 6379)],
+            "hosts": [(os.getenv('REDIS_HOST', '127.0.0.1'), 6379)],
         },
     },
+    # single node deployments and tests, no Redis needed
+    'memory': {
+        "BACKEND": "channels.layers.InMemoryChannelLayer",
+    },
+}
+CHANNEL_LAYERS = {
+    "default": CHANNEL_LAYER_BACKENDS[os.getenv('CHANNEL_LAYER', 'redis')],
 }
 
+CHAT_BUFFER_SIZE = 100
+CHAT_FLUSH_INTERVAL_MS = 200
+CHAT_MEMBERSHIP_TTL = 60
+CHAT_UPLOAD_MAX_SIZE = 512 * 1024 * 1024
+CHAT_UPLOAD_MAX_CHUNK = 16 * 1024 * 1024
+ORDER_POSITION_INTERVAL_MS = 1000
+COURIER_TRAIL_MIN_SECONDS = 15
+COURIER_TRAIL_MIN_METERS = 50
+COURIER_LOCATION_FLUSH_SIZE = 500
+COURIER_LOCATION_FLUSH_MS = 2000
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
@@ -105,6 +123,32 @@ DATABASES = {
 }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# 0 turns the catalogue response cache off
+CATALOGUE_CACHE_TIMEOUT = 300
+CATALOGUE_LRU_SIZE = 256
+
+# review signals drop the leaderboard; the timeout bounds staleness from bulk writes that skip them
+LEADERBOARD_CACHE_TIMEOUT = 600
+
+STATS_AGGREGATION_LAG_SECONDS = 60
+
+# the stub geocoder answers with made-up points, so only DEBUG defaults to it
+GEOCODER = os.getenv('GEOCODER', 'store.geocoding.StubGeocoder' if DEBUG else 'store.geocoding.NominatimGeocoder')
+GEOCODE_CACHE_PATH = BASE_DIR / 'geocode_cache.sqlite3'
+# addresses are geocoded after commit by a pool of this size; 0 geocodes inline
+GEOCODE_WORKERS = int(os.getenv('GEOCODE_WORKERS', 1))
+
+# thumbnails are rendered by a process pool of this size; 0 renders inline
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+THUMBNAIL_SIZES = {'small': (160, 160), 'medium': (480, 480)}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -159,7 +203,8 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'store.pagination.IdCursorPagination',
 }
 
 # Default primary key field type
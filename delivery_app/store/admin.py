@@ -46,10 +46,18 @@ class StoreAdmin(TranslationAdmin):
         }
 
 
+@admin.register(Courier)
+class CourierAdmin(admin.ModelAdmin):
+    list_display = ['user', 'status', 'avg_rating', 'review_count']
+    list_filter = ['status']
+    ordering = ['-avg_rating', '-review_count']
+    readonly_fields = ['rating_sum', 'review_count', 'avg_rating']
+
+
 admin.site.register(UserProfile)
 admin.site.register(StoreReview)
 admin.site.register(Order)
-admin.site.register(Courier)
+admin.site.register(OrderItem)
 admin.site.register(CourierReview)
 admin.site.register(Cart)
 admin.site.register(CarItem)
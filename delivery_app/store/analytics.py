@@ -0,0 +1,126 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import AggregationWatermark, OrderItem, StoreDailyStats, StoreReview
+from .order_status import CANCELLED
+
+METRICS = ('order_count', 'revenue', 'review_count', 'rating_sum')
+ORDER_AGGREGATES = {'order_count': Count('order_id', distinct=True), 'revenue': Sum(F('price') * F('quantity'))}
+
+
+def _order_items():
+    # OrderItem.store is a snapshot, so items of deleted products still count
+    return OrderItem.objects.filter(store__isnull=False).annotate(
+        store_id_=F('store_id'), date_=TruncDate('order__created_date'))
+
+
+def _advance(name, queryset, group_by, aggregates, recent_field=None, lag=None):
+    """
+    Aggregate the rows of queryset with id above the watermark `name` and
+    return (watermark, {(store_id, date): {metric: value}}, new last id).
+    With recent_field, processing stops before the first row newer than
+    lag, so rows of transactions still in flight are not skipped.
+    """
+    watermark, _ = AggregationWatermark.objects.select_for_update().get_or_create(name=name)
+    rows = queryset.filter(pk__gt=watermark.last_id)
+    last_id = rows.order_by('-pk').values_list('pk', flat=True).first()
+    if recent_field is not None and last_id is not None:
+        first_recent = (rows.filter(**{f'{recent_field}__gte': timezone.now() - lag})
+                        .order_by('pk').values_list('pk', flat=True).first())
+        if first_recent is not None:
+            last_id = first_recent - 1 if first_recent - 1 > watermark.last_id else None
+    if last_id is None:
+        return watermark, {}, None
+    totals = {}
+    for row in rows.filter(pk__lte=last_id).values(*group_by).annotate(**aggregates).order_by():
+        key = (row[group_by[0]], row[group_by[1]])
+        totals[key] = {metric: row[metric] for metric in aggregates}
+    return watermark, totals, last_id
+
+
+def _merge(totals, sign=1):
+    if not totals:
+        return
+    existing = {
+        (stats.store_id, stats.date): stats
+        for stats in StoreDailyStats.objects.filter(
+            store_id__in={key[0] for key in totals}, date__in={key[1] for key in totals})
+    }
+    to_create, to_update = [], []
+    for (store_id, date), metrics in totals.items():
+        stats = existing.get((store_id, date))
+        if stats is None:
+            if sign < 0:
+                continue
+            to_create.append(StoreDailyStats(store_id=store_id, date=date, **metrics))
+            continue
+        for metric, value in metrics.items():
+            setattr(stats, metric, getattr(stats, metric) + sign * (value or 0))
+        to_update.append(stats)
+    StoreDailyStats.objects.bulk_create(to_create, batch_size=1000)
+    StoreDailyStats.objects.bulk_update(to_update, METRICS, batch_size=1000)
+
+
+def aggregate_daily_stats():
+    """
+    Fold order items and store reviews added since the last run into
+    StoreDailyStats. Each source is processed in its own transaction
+    together with its watermark, so a row is counted exactly once. Items
+    of cancelled orders are skipped; orders cancelled after they were
+    counted are taken out again by retract_order(). Review edits are not
+    reflected.
+    """
+    lag = timedelta(seconds=getattr(settings, 'STATS_AGGREGATION_LAG_SECONDS', 60))
+    sources = (
+        ('order_items',
+         _order_items().exclude(order__status=CANCELLED),
+         ('store_id_', 'date_'),
+         ORDER_AGGREGATES,
+         'order__created_date'),
+        ('store_reviews',
+         StoreReview.objects.annotate(store_id_=F('store_id'), date_=TruncDate('created_date')),
+         ('store_id_', 'date_'),
+         {'review_count': Count('id'), 'rating_sum': Sum('rating')},
+         'added_date'),
+    )
+    processed = {}
+    for name, queryset, group_by, aggregates, recent_field in sources:
+        with transaction.atomic():
+            watermark, totals, last_id = _advance(name, queryset, group_by, aggregates, recent_field, lag)
+            if last_id is None:
+                processed[name] = 0
+                continue
+            _merge(totals)
+            watermark.last_id = last_id
+            watermark.save(update_fields=['last_id'])
+            processed[name] = len(totals)
+    return processed
+
+
+def retract_order(order_id):
+    """
+    Take a cancelled order out of the rollups it was already counted in.
+    Call it in the transaction that cancels the order; items above the
+    watermark are skipped by the next aggregate_daily_stats() instead.
+    """
+    watermark, _ = AggregationWatermark.objects.select_for_update().get_or_create(name='order_items')
+    rows = (_order_items().filter(order_id=order_id, pk__lte=watermark.last_id)
+            .values('store_id_', 'date_').annotate(**ORDER_AGGREGATES).order_by())
+    _merge({(row['store_id_'], row['date_']): {metric: row[metric] for metric in ORDER_AGGREGATES} for row in rows},
+           sign=-1)
+
+
+def get_daily_stats(store_id, days):
+    start = timezone.localdate() - timedelta(days=days - 1)
+    rows = {row['date']: row for row in StoreDailyStats.objects.filter(store_id=store_id, date__gte=start)
+            .order_by('date').values('date', *METRICS)}
+    result = []
+    for offset in range(days):
+        date = start + timedelta(days=offset)
+        row = rows.get(date) or {'date': date, **dict.fromkeys(METRICS, 0)}
+        row['avg_rating'] = round(row['rating_sum'] / row['review_count'], 1) if row['review_count'] else 0
+        result.append(row)
+    return result
@@ -0,0 +1,111 @@
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from .cache import acached_response
+from .fastpath import FastJSONRenderer
+from .models import Order, Product, Store
+from .prefetch import plan_queryset
+from .serializers import StoreDetailSerializer, fast_product, fast_store_list
+
+# Plain Django async views for the hot read paths. They share serializers
+# and the prefetch planner with the DRF views in views.py: every row (and
+# its prefetched relations) is loaded by one awaited ORM call, so
+# serialization afterwards runs without touching the database. Lists go
+# through the compiled serializers from fastpath.py.
+
+renderer = FastJSONRenderer()
+authentication = JWTStatelessUserAuthentication()
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def _int_param(request, name, default=None):
+    try:
+        return int(request.GET[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _render(data):
+    return renderer.render(data), 'application/json'
+
+
+async def _page(request, queryset, fast_serializer):
+    """Keyset page by -id: ?after=<id of the last row>&page_size=<n>."""
+    page_size = min(max(_int_param(request, 'page_size', PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    queryset = fast_serializer.rows(queryset.order_by('-id'), ['id'])
+    after = _int_param(request, 'after')
+    if after is not None:
+        queryset = queryset.filter(pk__lt=after)
+
+    rows = [row async for row in queryset[:page_size + 1]]
+    next_url = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        query = request.GET.copy()
+        query['after'] = rows[-1].id
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+    return {'next': next_url, 'results': fast_serializer.serialize(rows, request)}
+
+
+@require_safe
+async def store_list(request):
+    """
+    Stores newest first, optionally by ?category=. Pages are keyed by id, so
+    ?search= (ranked) and ?ordering= are only served by the DRF /store/ list
+    and are rejected here rather than silently ignored.
+    """
+    unsupported = [name for name in ('search', 'ordering') if name in request.GET]
+    if unsupported:
+        return JsonResponse({'detail': f'Параметры {", ".join(unsupported)} поддерживаются только в /store/'},
+                            status=400)
+
+    async def render():
+        queryset = Store.objects.all()
+        category = _int_param(request, 'category')
+        if category is not None:
+            queryset = queryset.filter(category=category)
+        return _render(await _page(request, queryset, fast_store_list))
+    return await acached_response(request, render)
+
+
+@require_safe
+async def store_detail(request, pk):
+    async def render():
+        queryset = plan_queryset(Store.objects.all(), StoreDetailSerializer)
+        try:
+            store = await queryset.aget(pk=pk)
+        except Store.DoesNotExist:
+            raise Http404
+        return _render(StoreDetailSerializer(store, context={'request': request}).data)
+    return await acached_response(request, render)
+
+
+@require_safe
+async def product_list(request):
+    queryset = Product.objects.all()
+    store = _int_param(request, 'store')
+    if store is not None:
+        queryset = queryset.filter(store=store)
+    return HttpResponse(*_render(await _page(request, queryset, fast_product)))
+
+
+@require_safe
+async def order_status(request, pk):
+    try:
+        authenticated = authentication.authenticate(request)
+    except AuthenticationFailed as exc:
+        return JsonResponse({'detail': str(exc.detail)}, status=401)
+    if authenticated is None:
+        return JsonResponse({'detail': 'Учетные данные не были предоставлены.'}, status=401)
+    user = authenticated[0]
+
+    try:
+        order = await Order.objects.only('id', 'status', 'client_id', 'courier_id', 'total_price').aget(pk=pk)
+    except Order.DoesNotExist:
+        raise Http404
+    if user.pk not in (order.client_id, order.courier_id):
+        return JsonResponse({'detail': 'У вас недостаточно прав для выполнения данного действия.'}, status=403)
+    return HttpResponse(*_render({'id': order.pk, 'status': order.status,
+                                  'courier': order.courier_id, 'total_price': order.total_price}))
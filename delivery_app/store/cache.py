@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import translation
+from django.utils.cache import get_conditional_response
+
+VERSION_KEY = 'catalogue:version'
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LRUCache(getattr(settings, 'CATALOGUE_LRU_SIZE', 256))
+
+
+def get_catalogue_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, str(time.time_ns()), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aget_catalogue_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, str(time.time_ns()), None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def _bump_version():
+    # a fresh token instead of incr(), so a version lost from the shared
+    # cache can never come back and revive stale local entries
+    cache.set(VERSION_KEY, str(time.time_ns()), None)
+
+
+def is_enabled():
+    return getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300) != 0
+
+
+def invalidate_catalogue():
+    _bump_version()
+    transaction.on_commit(_bump_version)
+
+
+def make_entry(content, content_type):
+    return content, content_type, f'"{hashlib.md5(content).hexdigest()}"'
+
+
+def make_key(request, version):
+    path = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'catalogue:{version}:{translation.get_language()}:{path}'
+
+
+class CatalogueCacheMixin:
+    """
+    Caches the rendered JSON of a GET per language and URL, first in a
+    per-process LRU and then in the default Django cache. Any change to the
+    catalogue models changes the version part of the key (see signals.py).
+    CATALOGUE_CACHE_TIMEOUT = 0 turns the cache off.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json' or not is_enabled():
+            return super().get(request, *args, **kwargs)
+
+        key = make_key(request, get_catalogue_version())
+        entry = local_cache.get(key)
+        if entry is None:
+            entry = cache.get(key)
+            if entry is None:
+                response = super().get(request, *args, **kwargs)
+                entry = self.render_entry(response)
+                if entry is None:
+                    return response
+                cache.set(key, entry, getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300))
+            local_cache.set(key, entry)
+
+        return entry_response(request, entry)
+
+    def render_entry(self, response):
+        if response.status_code != 200:
+            return None
+        renderer = self.request.accepted_renderer
+        content = renderer.render(response.data, self.request.accepted_media_type, self.get_renderer_context())
+        content_type = f'{renderer.media_type}; charset={renderer.charset}' if renderer.charset else renderer.media_type
+        return make_entry(content, content_type)
+
+
+def entry_response(request, entry):
+    content, content_type, etag = entry
+    response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    response['Vary'] = 'Accept, Accept-Language'
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+async def acached_response(request, render):
+    """
+    Async counterpart of CatalogueCacheMixin.get for plain async views.
+    render() is awaited on a miss and returns (content, content_type).
+    """
+    if not is_enabled():
+        content, content_type = await render()
+        return HttpResponse(content, content_type=content_type)
+    key = make_key(request, await aget_catalogue_version())
+    entry = local_cache.get(key)
+    if entry is None:
+        entry = await cache.aget(key)
+        if entry is None:
+            entry = make_entry(*await render())
+            await cache.aset(key, entry, getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300))
+        local_cache.set(key, entry)
+    return entry_response(request, entry)
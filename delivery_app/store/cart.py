@@ -0,0 +1,63 @@
+from django.db import transaction
+from .models import Cart, CarItem, Product
+
+# PositiveSmallIntegerField's upper bound
+MAX_QUANTITY = 32767
+
+
+class CartError(Exception):
+    pass
+
+
+def apply_cart_operations(user, operations):
+    """
+    Apply a list of {'op': 'add'|'update'|'remove', 'product_id', 'quantity'}
+    to the user's cart in one transaction: one query to read the cart items,
+    one to check the products, then bulk_create/bulk_update/delete. Adds
+    that would overflow the quantity column stop at MAX_QUANTITY.
+    """
+    with transaction.atomic():
+        cart, _ = Cart.objects.select_for_update().get_or_create(user=user)
+
+        product_ids = {operation['product_id'] for operation in operations}
+        found = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+        if product_ids - found:
+            raise CartError(f'Товар не найден: {sorted(product_ids - found)}')
+
+        items, to_delete = {}, []
+        for item in CarItem.objects.filter(cart=cart).order_by('id'):
+            if item.product_id in items:
+                items[item.product_id].quantity = min(items[item.product_id].quantity + item.quantity, MAX_QUANTITY)
+                to_delete.append(item.pk)
+            else:
+                items[item.product_id] = item
+        original = {product_id: item.quantity for product_id, item in items.items()}
+
+        for operation in operations:
+            product_id, quantity = operation['product_id'], operation.get('quantity', 1)
+            item = items.get(product_id)
+            if operation['op'] == 'add':
+                if item is None:
+                    items[product_id] = CarItem(cart=cart, product_id=product_id, quantity=quantity)
+                else:
+                    item.quantity = min(item.quantity + quantity, MAX_QUANTITY)
+            elif operation['op'] == 'update' and quantity > 0:
+                if item is None:
+                    items[product_id] = CarItem(cart=cart, product_id=product_id, quantity=quantity)
+                else:
+                    item.quantity = quantity
+            else:
+                removed = items.pop(product_id, None)
+                if removed is not None and removed.pk:
+                    to_delete.append(removed.pk)
+
+        to_create = [item for item in items.values() if item.pk is None]
+        to_update = [item for item in items.values()
+                     if item.pk is not None and item.quantity != original[item.product_id]]
+        if to_delete:
+            CarItem.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            CarItem.objects.bulk_update(to_update, ['quantity'])
+        if to_create:
+            CarItem.objects.bulk_create(to_create)
+    return cart
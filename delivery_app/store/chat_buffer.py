@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+
+def _save_messages(batch):
+    try:
+        with transaction.atomic():
+            Message.objects.bulk_create(batch)
+        return
+    except IntegrityError:
+        pass
+    # one bad row (e.g. a chat deleted meanwhile) must not block the rest of the batch
+    for message in batch:
+        try:
+            with transaction.atomic():
+                message.save()
+        except IntegrityError:
+            logger.warning('Dropping chat message for chat %s: integrity error', message.chat_id)
+
+
+class MessageBuffer:
+    """
+    Write-behind buffer for chat messages. Messages are written with
+    bulk_create once max_size of them are queued or interval seconds after
+    the first one arrived. A batch that fails to save is put back in the
+    queue and retried.
+    """
+
+    def __init__(self, max_size, interval):
+        self.max_size = max_size
+        self.interval = interval
+        self._pending = []
+        self._timer = None
+        self._lock = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def add(self, message):
+        self._pending.append(message)
+        if len(self._pending) >= self.max_size:
+            await self.flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while self._pending:
+                batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+                try:
+                    await database_sync_to_async(_save_messages)(batch)
+                except Exception:
+                    logger.exception('Failed to save %s chat messages, will retry', len(batch))
+                    self._pending = batch + self._pending
+                    if self._timer is None or self._timer.done():
+                        self._timer = asyncio.ensure_future(self._flush_later())
+                    return
+
+
+message_buffer = MessageBuffer(
+    max_size=getattr(settings, 'CHAT_BUFFER_SIZE', 100),
+    interval=getattr(settings, 'CHAT_FLUSH_INTERVAL_MS', 200) / 1000,
+)
@@ -0,0 +1,55 @@
+from django.db import OperationalError, transaction
+from django.db.models import F, Sum
+from .models import Cart, CarItem, Order, OrderItem
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class CheckoutConflict(CheckoutError):
+    pass
+
+
+def checkout(user, delivery_address):
+    """
+    Turn the user's cart into an Order with frozen line-item prices and
+    empty the cart, all in one transaction. Two concurrent checkouts of the
+    same cart cannot both succeed: the cart row is locked where the
+    database supports it, and the items are deleted by id, so the loser
+    sees a changed cart and is rolled back. On SQLite the loser may find
+    the database locked instead; both cases raise CheckoutConflict.
+    """
+    try:
+        return _checkout(user, delivery_address)
+    except OperationalError as e:
+        if 'locked' not in str(e):
+            raise
+        raise CheckoutConflict('Корзина оформляется в другом запросе, попробуйте еще раз') from e
+
+
+def _checkout(user, delivery_address):
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().filter(user=user).first()
+        if cart is None:
+            raise CheckoutError('Корзина пуста')
+
+        items = list(CarItem.objects.filter(cart=cart).values_list(
+            'id', 'product_id', 'product__store_id', 'product__product_name', 'product__price', 'quantity'))
+        if not items:
+            raise CheckoutError('Корзина пуста')
+
+        order = Order.objects.create(client=user, cart=cart, delivery_address=delivery_address)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, store_id=store_id, product_name=product_name, price=price,
+                      quantity=quantity)
+            for _, product_id, store_id, product_name, price, quantity in items
+        ])
+        order.total_price = (OrderItem.objects.filter(order=order)
+                             .aggregate(total=Sum(F('price') * F('quantity')))['total'])
+        Order.objects.filter(pk=order.pk).update(total_price=order.total_price)
+
+        deleted, _ = CarItem.objects.filter(pk__in=[item[0] for item in items]).delete()
+        if deleted != len(items):
+            raise CheckoutConflict('Корзина изменилась, попробуйте еще раз')
+    return order
@@ -1,11 +1,27 @@
+import asyncio
 import json
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from .chat_buffer import message_buffer
+from .locations import ingestor
+from .membership import chat_membership
+from .models import Courier, Message, Order
+from .serializers import LocationBatchSerializer
+from .tracking import order_group
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
         self.room_group_name = f"chat_{self.room_name}"
+        self.user = self.scope.get("user")
+
+        # Only members of the chat can join its room
+        if not await self.can_join():
+            await self.close()
+            return
+        self.chat_id = int(self.room_name)
 
         # Join room group
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
@@ -15,12 +31,16 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         # Leave room group
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await message_buffer.flush()
 
     # Receive message from WebSocket
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
         message = text_data_json["message"]
 
+        # Save through the write-behind buffer, the room does not wait for the database
+        await self.save_message(message)
+
         # Send message to room group
         await self.channel_layer.group_send(
             self.room_group_name, {"type": "chat.message", "message": message}
@@ -31,4 +51,108 @@ class ChatConsumer(AsyncWebsocketConsumer):
         message = event["message"]
 
         # Send message to WebSocket
-        await self.send(text_data=json.dumps({"message": message}))
\ No newline at end of file
+        await self.send(text_data=json.dumps({"message": message}))
+
+    async def can_join(self):
+        if self.user is None or not self.user.is_authenticated or not self.room_name.isdigit():
+            return False
+        return await chat_membership.is_member(int(self.room_name), self.user.pk)
+
+    async def save_message(self, message):
+        await message_buffer.add(Message(chat_id=self.chat_id, author_id=self.user.pk, text=message))
+
+
+class OrderTrackingConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes status changes and courier positions of one order. Positions are
+    coalesced: a client gets at most one every ORDER_POSITION_INTERVAL_MS,
+    always the latest, however many pings arrive in between.
+    """
+
+    async def connect(self):
+        self.order_id = self.scope["url_route"]["kwargs"]["order_id"]
+        self.group_name = order_group(self.order_id)
+        self.latest_position = None
+        self.position_task = None
+
+        order = await self.get_order()
+        if order is None:
+            await self.close()
+            return
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send(text_data=json.dumps({"type": "status", "status": order["status"],
+                                              "courier": order["courier_id"]}))
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if self.position_task is not None:
+            self.position_task.cancel()
+
+    async def order_status(self, event):
+        await self.send(text_data=json.dumps({"type": "status", "status": event["status"],
+                                              "courier": event["courier"]}))
+
+    async def courier_position(self, event):
+        self.latest_position = event
+        if self.position_task is None or self.position_task.done():
+            self.position_task = asyncio.ensure_future(self.send_positions())
+
+    async def send_positions(self):
+        interval = getattr(settings, 'ORDER_POSITION_INTERVAL_MS', 1000) / 1000
+        while self.latest_position is not None:
+            event, self.latest_position = self.latest_position, None
+            await self.send(text_data=json.dumps({"type": "position", "latitude": event["latitude"],
+                                                  "longitude": event["longitude"]}))
+            await asyncio.sleep(interval)
+
+    @database_sync_to_async
+    def get_order(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            return None
+        order = Order.objects.filter(pk=self.order_id).values("status", "client_id", "courier_id").first()
+        if order is None or user.pk not in (order["client_id"], order["courier_id"]):
+            return None
+        return order
+
+
+class CourierLocationConsumer(AsyncWebsocketConsumer):
+    """Couriers stream {"latitude": .., "longitude": .., "timestamp": ..} pings, one object or a list."""
+
+    async def connect(self):
+        self.courier_id = await self.get_courier_id()
+        if self.courier_id is None:
+            await self.close()
+            return
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if getattr(self, "courier_id", None) is not None:
+            await database_sync_to_async(ingestor.flush)()
+
+    async def receive(self, text_data):
+        try:
+            points = json.loads(text_data)
+        except ValueError:
+            points = None
+        if isinstance(points, dict):
+            points = [points]
+        serializer = LocationBatchSerializer(data={"points": points})
+        if not serializer.is_valid():
+            await self.send(text_data=json.dumps({"error": "invalid location"}))
+            return
+        flush = False
+        for point in serializer.validated_data["points"]:
+            flush = ingestor.record(self.courier_id, point["latitude"], point["longitude"], point.get("timestamp"))
+        if flush:
+            await database_sync_to_async(ingestor.flush)()
+
+    @database_sync_to_async
+    def get_courier_id(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            return None
+        return Courier.objects.filter(user_id=user.pk).values_list("id", flat=True).first()
+
@@ -0,0 +1,166 @@
+import math
+from django.db import transaction
+from .geocoding import KM_PER_DEGREE
+from .models import Courier, Order, OrderEvent
+from .order_status import COURIER_BUSY, COURIER_FREE, IN_DELIVERY, PENDING
+from .tracking import publish_order_status, publish_courier_position
+
+
+class CourierGrid:
+    """
+    Uniform grid over lat/lon projected to kilometres. nearest() looks at
+    rings of cells around the point and stops once no unvisited cell can
+    hold a closer courier than the best one found.
+    """
+
+    def __init__(self, cell_km=1.0, ref_latitude=0.0):
+        self.cell_km = cell_km
+        self.lon_km = KM_PER_DEGREE * math.cos(math.radians(ref_latitude))
+        self.cells = {}
+        self.positions = {}
+        self.bounds = None
+
+    def _project(self, lat, lon):
+        return lat * KM_PER_DEGREE, lon * self.lon_km
+
+    def _cell(self, y, x):
+        return int(y // self.cell_km), int(x // self.cell_km)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, key, lat, lon):
+        y, x = self._project(lat, lon)
+        cell = self._cell(y, x)
+        self.positions[key] = (y, x, cell)
+        self.cells.setdefault(cell, set()).add(key)
+        if self.bounds is None:
+            self.bounds = [cell[0], cell[0], cell[1], cell[1]]
+        else:
+            self.bounds = [min(self.bounds[0], cell[0]), max(self.bounds[1], cell[0]),
+                           min(self.bounds[2], cell[1]), max(self.bounds[3], cell[1])]
+
+    def remove(self, key):
+        y, x, cell = self.positions.pop(key)
+        members = self.cells[cell]
+        members.discard(key)
+        if not members:
+            del self.cells[cell]
+
+    def nearest(self, lat, lon, max_km=None):
+        if not self.positions:
+            return None
+        y, x = self._project(lat, lon)
+        cy, cx = self._cell(y, x)
+        best, best_distance = None, math.inf
+        max_ring = math.inf if max_km is None else int(max_km // self.cell_km) + 1
+        ring = 0
+        while ring <= max_ring:
+            # every cell of this ring is at least (ring - 1) cells away from the point
+            if (ring - 1) * self.cell_km > best_distance:
+                break
+            for cell in self._ring(cy, cx, ring):
+                for key in self.cells.get(cell, ()):
+                    ky, kx, _ = self.positions[key]
+                    distance = math.hypot(ky - y, kx - x)
+                    if distance < best_distance:
+                        best, best_distance = key, distance
+            if ring > 0 and ring * self.cell_km > self._extent(cy, cx):
+                break
+            ring += 1
+        if max_km is not None and best_distance > max_km:
+            return None
+        return best
+
+    def _extent(self, cy, cx):
+        # rings past this distance (km) are outside every cell ever occupied
+        min_y, max_y, min_x, max_x = self.bounds
+        return max(cy - min_y, max_y - cy, cx - min_x, max_x - cx) * self.cell_km
+
+    @staticmethod
+    def _ring(cy, cx, ring):
+        if ring == 0:
+            yield cy, cx
+            return
+        for dx in range(-ring, ring + 1):
+            yield cy - ring, cx + dx
+            yield cy + ring, cx + dx
+        for dy in range(-ring + 1, ring):
+            yield cy + dy, cx - ring
+            yield cy + dy, cx + ring
+
+
+def match_orders(orders, couriers, cell_km=1.0, max_km=None):
+    """
+    Greedy nearest-courier matching. orders and couriers are iterables of
+    (key, latitude, longitude); orders are served in the given order.
+    Returns a list of (order key, courier key).
+    """
+    couriers = list(couriers)
+    if not couriers:
+        return []
+    ref_latitude = sum(lat for _, lat, _ in couriers) / len(couriers)
+    grid = CourierGrid(cell_km=cell_km, ref_latitude=ref_latitude)
+    for key, lat, lon in couriers:
+        grid.add(key, lat, lon)
+
+    assignments = []
+    for order_key, lat, lon in orders:
+        courier_key = grid.nearest(lat, lon, max_km=max_km)
+        if courier_key is None:
+            if not grid:
+                break
+            continue
+        grid.remove(courier_key)
+        assignments.append((order_key, courier_key))
+    return assignments
+
+
+def dispatch_pending_orders(batch_size=1000, cell_km=1.0, max_km=None):
+    """
+    Assign the oldest pending orders without a courier to the nearest
+    available couriers. Orders and couriers are changed in one transaction;
+    rows locked by another dispatcher are skipped.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(status=PENDING, courier__isnull=True, latitude__isnull=False, longitude__isnull=False)
+            .order_by('created_date', 'id')
+            .only('id', 'latitude', 'longitude')[:batch_size]
+        )
+        if not orders:
+            return []
+        couriers = {
+            courier.pk: courier for courier in
+            Courier.objects.select_for_update(skip_locked=True)
+            .filter(status=COURIER_FREE, latitude__isnull=False, longitude__isnull=False)
+            .only('id', 'user_id', 'latitude', 'longitude')
+        }
+        orders_by_id = {order.pk: order for order in orders}
+
+        assignments = match_orders(
+            ((order.pk, order.latitude, order.longitude) for order in orders),
+            ((courier.pk, courier.latitude, courier.longitude) for courier in couriers.values()),
+            cell_km=cell_km, max_km=max_km,
+        )
+        changed_orders, changed_couriers = [], []
+        for order_id, courier_id in assignments:
+            order, courier = orders_by_id[order_id], couriers[courier_id]
+            order.courier_id = courier.user_id
+            order.status = IN_DELIVERY
+            courier.current_orders_id = order.pk
+            courier.status = COURIER_BUSY
+            changed_orders.append(order)
+            changed_couriers.append(courier)
+
+        Order.objects.bulk_update(changed_orders, ['courier', 'status'], batch_size=500)
+        Courier.objects.bulk_update(changed_couriers, ['current_orders', 'status'], batch_size=500)
+        OrderEvent.objects.bulk_create([
+            OrderEvent(order_id=order.pk, from_status=PENDING, to_status=IN_DELIVERY) for order in changed_orders
+        ], batch_size=500)
+        # bulk writes send no signals
+        for order, courier in zip(changed_orders, changed_couriers):
+            publish_order_status(order.pk, IN_DELIVERY, courier.user_id)
+            publish_courier_position(order.pk, courier.latitude, courier.longitude)
+    return assignments
@@ -0,0 +1,103 @@
+import csv
+import json
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+from .models import CourierReview, Order, OrderItem, Product, StoreReview
+from .prefetch import plan_queryset
+from .serializers import (CourierReviewSerializer, OrderSerializer, OwnerOrderSerializer, ProductSerializer,
+                          StoreReviewSerializer, prefetch_owner_items)
+
+CHUNK_SIZE = 2000
+# rows serialized per thread hop when streaming to an ASGI server
+ASYNC_BLOCK_SIZE = 500
+FORMATS = ('ndjson', 'csv')
+
+
+# kind -> (model, serializer, rows an owner may export); None means staff only
+EXPORTS = {
+    'orders': (Order, OrderSerializer,
+               lambda user: Q(pk__in=OrderItem.objects.filter(store__owner=user).values('order_id'))),
+    'store_reviews': (StoreReview, StoreReviewSerializer, lambda user: Q(store__owner=user)),
+    'courier_reviews': (CourierReview, CourierReviewSerializer, None),
+    'products': (Product, ProductSerializer, lambda user: Q(store__owner=user)),
+}
+
+
+def export_queryset(kind, user):
+    """Return (queryset, serializer_class) for kind, or None if user may not export it."""
+    model, serializer_class, owner_scope = EXPORTS[kind]
+    queryset = model.objects.all()
+    if user.is_staff:
+        return plan_queryset(queryset, serializer_class).order_by('pk'), serializer_class
+    if owner_scope is None or user.user_role != 'владелец':
+        return None
+    queryset = queryset.filter(owner_scope(user))
+    if model is Order:
+        return prefetch_owner_items(queryset, user).order_by('pk'), OwnerOrderSerializer
+    return plan_queryset(queryset, serializer_class).order_by('pk'), serializer_class
+
+
+def iter_rows(queryset, serializer):
+    # iterator() keeps only one chunk of rows (and its prefetched
+    # relations) in memory at a time
+    for obj in queryset.iterator(chunk_size=CHUNK_SIZE):
+        yield serializer.to_representation(obj)
+
+
+def iter_ndjson(rows):
+    encoder = JSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, fieldnames):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fieldnames)
+    for row in rows:
+        # nested objects and lists go into a single JSON cell
+        yield writer.writerow([
+            json.dumps(row[name], cls=JSONEncoder, ensure_ascii=False) if isinstance(row[name], (dict, list))
+            else row[name]
+            for name in fieldnames])
+
+
+def _next_block(content):
+    return ''.join(line for _, line in zip(range(ASYNC_BLOCK_SIZE), content))
+
+
+async def aiter_blocks(content):
+    # Django's ASGI handler would collect a sync iterator into a list
+    # before sending anything, so hop to a thread for each block instead.
+    # thread_sensitive keeps every hop, and the open cursor, on one thread.
+    next_block = sync_to_async(_next_block, thread_sensitive=True)
+    while True:
+        block = await next_block(content)
+        if not block:
+            return
+        yield block
+
+
+def stream_export(request, kind, queryset, serializer_class, fmt):
+    # one serializer for the whole export: its fields are built once and
+    # to_representation() is called per row
+    serializer = serializer_class()
+    rows = iter_rows(queryset, serializer)
+    if fmt == 'csv':
+        content = iter_csv(rows, [field.field_name for field in serializer._readable_fields])
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        content = iter_ndjson(rows)
+        content_type = 'application/x-ndjson; charset=utf-8'
+    if isinstance(request, ASGIRequest):
+        content = aiter_blocks(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
@@ -0,0 +1,193 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import FileField
+from django.utils.translation import get_language
+from modeltranslation.translator import NotRegistered, translator
+from modeltranslation.utils import build_localized_fieldname, resolution_order
+from rest_framework import serializers
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# DRF field types whose to_representation() is the identity for what the
+# database adapter already returns
+PLAIN_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+                serializers.PrimaryKeyRelatedField)
+
+
+def translated_fields(model):
+    try:
+        return translator.get_options_for_model(model).fields
+    except NotRegistered:
+        return {}
+
+
+class FastSerializer:
+    """
+    Read-only, wire-compatible fast path for a DRF ModelSerializer used by
+    list endpoints. The serializer's fields are compiled (once per language)
+    into a list of values_list() columns and per-field accessors, so rows
+    are built straight from tuples without model instances or per-object
+    nested serializers.
+
+    Supports plain, file/image, datetime-like, translated and FK nested
+    fields. SerializerMethodFields need an entry in methods: name ->
+    (function, source columns); the function gets the row, whose
+    attributes are the selected columns.
+    """
+
+    def __init__(self, serializer_class, methods=None):
+        self.serializer_class = serializer_class
+        self.methods = methods or {}
+        self._compiled = {}
+
+    def compile(self, language):
+        compiled = self._compiled.get(language)
+        if compiled is None:
+            columns = []
+            plan = self._compile_fields(self.serializer_class(), self.serializer_class.Meta.model,
+                                        '', columns, resolution_order(language))
+            compiled = self._compiled[language] = (tuple(columns), plan)
+        return compiled
+
+    def rows(self, queryset, ordering=()):
+        """values_list() queryset for queryset, plus any columns ordering needs (e.g. for cursors)."""
+        columns, _ = self.compile(get_language())
+        extra = [field.lstrip('-') for field in ordering if field.lstrip('-') not in columns]
+        return queryset.select_related(None).prefetch_related(None).values_list(*columns, *extra, named=True)
+
+    def serialize(self, rows, request=None):
+        _, plan = self.compile(get_language())
+        return [_build(plan, row, request) for row in rows]
+
+    def _compile_fields(self, serializer, model, prefix, columns, languages):
+        def column(path):
+            if path not in columns:
+                columns.append(path)
+            return columns.index(path)
+
+        translated = translated_fields(model)
+        plan = []
+        for field in serializer._readable_fields:
+            name = field.field_name
+            if isinstance(field, serializers.SerializerMethodField):
+                if prefix or name not in self.methods:
+                    raise ImproperlyConfigured(f'{type(serializer).__name__}.{name} has no fast path')
+                function, sources = self.methods[name]
+                for source in sources:
+                    column(source)
+                plan.append((name, None, _method(function)))
+                continue
+
+            if len(field.source_attrs) != 1:
+                raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: dotted sources are not supported')
+            source = field.source_attrs[0]
+            path = prefix + source
+
+            if isinstance(field, serializers.ListSerializer):
+                raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: many=True is not supported')
+            if isinstance(field, serializers.BaseSerializer):
+                related = model._meta.get_field(source).related_model
+                nested = self._compile_fields(field, related, path + '__', columns, languages)
+                plan.append((name, None, _nested(column(path), nested)))
+            elif source in translated:
+                indexes = [column(build_localized_fieldname(path, language)) for language in languages]
+                plan.append((name, None, _translated(indexes, model._meta.get_field(source).get_default())))
+            elif isinstance(field, serializers.FileField):
+                plan.append((name, None, _file(column(path), model._meta.get_field(source))))
+            elif hasattr(field, 'represent'):
+                # fields that need the request, e.g. thumbnails.ThumbnailField
+                plan.append((name, None, _represent(column(path), field.represent)))
+            elif isinstance(field, PLAIN_FIELDS):
+                plan.append((name, column(path), None))
+            else:
+                plan.append((name, None, _convert(column(path), field.to_representation)))
+        return plan
+
+
+def _build(plan, row, request):
+    return {name: row[index] if function is None else function(row, request)
+            for name, index, function in plan}
+
+
+def _method(function):
+    return lambda row, request: function(row)
+
+
+def _nested(index, plan):
+    def build(row, request):
+        if row[index] is None:
+            return None
+        return _build(plan, row, request)
+    return build
+
+
+def _translated(indexes, default):
+    # same resolution as modeltranslation's field descriptor
+    def build(row, request):
+        for index in indexes:
+            value = row[index]
+            if value is not None and value != default:
+                return value
+        return default
+    return build
+
+
+def _file(index, model_field):
+    assert isinstance(model_field, FileField)
+
+    def build(row, request):
+        name = row[index]
+        if not name:
+            return None
+        url = model_field.storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return build
+
+
+def _represent(index, represent):
+    return lambda row, request: represent(row[index], request)
+
+
+def _convert(index, to_representation):
+    def build(row, request):
+        value = row[index]
+        return None if value is None else to_representation(value)
+    return build
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes with orjson when it is installed; output is byte-for-byte the same."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastListMixin:
+    """
+    Serves list() for JSON clients through fast_serializer. The browsable
+    API keeps the regular serializer.
+    """
+    fast_serializer = None
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        get_ordering = getattr(self.paginator, 'get_ordering', None)
+        ordering = get_ordering(request, queryset, self) if get_ordering else queryset.query.order_by
+        rows = self.fast_serializer.rows(queryset, ordering)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.fast_serializer.serialize(page, request))
+        return Response(self.fast_serializer.serialize(rows, request))
@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import math
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Bishkek, used by the stub geocoder and to bias real lookups
+CITY_LATITUDE = 42.8746
+CITY_LONGITUDE = 74.5698
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+
+def normalize_address(address):
+    address = re.sub(r'[.,;]+', ' ', address.lower())
+    return ' '.join(address.split())
+
+
+def bounding_box(latitude, longitude, radius_km):
+    lat_delta = radius_km / KM_PER_DEGREE
+    lon_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return latitude - lat_delta, latitude + lat_delta, longitude - lon_delta, longitude + lon_delta
+
+
+def haversine_many(latitude, longitude, points):
+    """
+    Distances in km from one point to many (key, latitude, longitude)
+    points, computed in one pass with the origin terms hoisted.
+    Returns a list of (distance, key).
+    """
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    cos_lat1 = math.cos(lat1)
+    sin, cos, asin, sqrt, radians = math.sin, math.cos, math.asin, math.sqrt, math.radians
+    result = []
+    for key, lat, lon in points:
+        lat2 = radians(lat)
+        a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((radians(lon) - lon1) / 2) ** 2
+        result.append((2 * EARTH_RADIUS_KM * asin(sqrt(a)), key))
+    return result
+
+
+class GeocodeError(Exception):
+    pass
+
+
+class StubGeocoder:
+    """Offline geocoder for tests: the same address always maps to the same point near the city centre."""
+
+    def geocode(self, address):
+        digest = hashlib.md5(address.encode()).digest()
+        return (CITY_LATITUDE + (digest[0] - 128) / 1280,
+                CITY_LONGITUDE + (digest[1] - 128) / 1280)
+
+
+class NominatimGeocoder:
+    url = 'https://nominatim.openstreetmap.org/search'
+
+    def geocode(self, address):
+        try:
+            response = requests.get(self.url, timeout=5, params={
+                'q': address, 'format': 'json', 'limit': 1, 'countrycodes': 'kg',
+            }, headers={'User-Agent': 'delivery_app'})
+            response.raise_for_status()
+            results = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise GeocodeError(str(e)) from e
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon'])
+
+
+class GeocodeCache:
+    """
+    On-disk cache of key -> (latitude, longitude), where the key is the
+    normalized address prefixed with the geocoder class, so switching
+    geocoders never serves another geocoder's answers. Addresses the
+    geocoder could not find are stored too, with empty coordinates.
+    """
+    MISSING = object()
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS geocode '
+                                     '(address TEXT PRIMARY KEY, latitude REAL, longitude REAL)')
+        return self._connection
+
+    def get(self, address):
+        with self._lock:
+            row = self.connection.execute('SELECT latitude, longitude FROM geocode WHERE address = ?',
+                                          (address,)).fetchone()
+        if row is None:
+            return self.MISSING
+        return None if row[0] is None else row
+
+    def set(self, address, point):
+        with self._lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO geocode VALUES (?, ?, ?)',
+                                    (address, *(point or (None, None))))
+
+
+_geocoder = None
+_cache = None
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_geocoder():
+    global _geocoder
+    if _geocoder is None:
+        _geocoder = import_string(settings.GEOCODER)()
+    return _geocoder
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = GeocodeCache(settings.GEOCODE_CACHE_PATH)
+    return _cache
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'GEOCODE_WORKERS', 1),
+                                           thread_name_prefix='geocode')
+        return _executor
+
+
+def geocode(address):
+    """
+    Return (latitude, longitude) for address or None if it cannot be found.
+    Raises GeocodeError if the geocoder is unavailable.
+    """
+    address = normalize_address(address or '')
+    if not address:
+        return None
+    geocoder = get_geocoder()
+    key = f'{type(geocoder).__module__}.{type(geocoder).__qualname__}:{address}'
+    cache = get_cache()
+    point = cache.get(key)
+    if point is GeocodeCache.MISSING:
+        point = geocoder.geocode(address)
+        cache.set(key, point)
+    return point
+
+
+def schedule(model, pk, address_field, address):
+    """Geocode model pk's address off the request path; call it after the saving transaction commits."""
+    if not getattr(settings, 'GEOCODE_WORKERS', 1):
+        update_coordinates(model, pk, address_field, address)
+        return
+    get_executor().submit(_run, model, pk, address_field, address)
+
+
+def _run(model, pk, address_field, address):
+    # runs on an executor thread, which has its own connection
+    try:
+        update_coordinates(model, pk, address_field, address)
+    except Exception:
+        logger.exception('Failed to geocode %s %s', model.__name__, pk)
+    finally:
+        connection.close()
+
+
+def update_coordinates(model, pk, address_field, address):
+    """
+    Set latitude/longitude of model pk from address, leaving them empty on
+    errors. Returns whether the row was updated; it is not if the address
+    changed again in the meantime.
+    """
+    try:
+        point = geocode(address)
+    except GeocodeError:
+        logger.warning('Geocoder unavailable for %s %s', model.__name__, pk)
+        return False
+    latitude, longitude = point or (None, None)
+    return bool(model.objects.filter(pk=pk, **{address_field: address})
+                .update(latitude=latitude, longitude=longitude))
@@ -0,0 +1,50 @@
+import hashlib
+import os
+from PIL import Image, ImageOps
+
+# Runs inside the thumbnail worker processes: no Django imports here, so
+# the module can be loaded by any multiprocessing start method.
+
+ENCODERS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def file_digest(file, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def variant_name(digest, size, fmt):
+    return f'thumbnails/{digest[:2]}/{digest}-{size}.{fmt}'
+
+
+def render_variants(source_path, media_root, sizes):
+    """
+    Write every size/format variant of source_path that is not on disk yet
+    and return the sha256 of the source. Variants are named by that digest,
+    so identical uploads share them and are only rendered once.
+    """
+    with open(source_path, 'rb') as file:
+        digest = file_digest(file)
+    missing = [(size, fmt, os.path.join(media_root, variant_name(digest, size, fmt)))
+               for size in sizes for fmt in ENCODERS]
+    missing = [variant for variant in missing if not os.path.exists(variant[2])]
+    if not missing:
+        return digest
+
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size, fmt, target in missing:
+            variant = image.copy()
+            variant.thumbnail(sizes[size], Image.LANCZOS)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # write then rename, so a concurrent reader never sees half a file
+            partial = f'{target}.{os.getpid()}.part'
+            encoder, options = ENCODERS[fmt]
+            variant.save(partial, encoder, **options)
+            os.replace(partial, target)
+    return digest
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, FloatField, When
+from django.db.models.functions import Cast
+from .models import Courier
+
+LEADERBOARD_KEY = 'courier:leaderboard'
+LEADERBOARD_SIZE = 100
+
+
+def avg_rating_expression():
+    return Case(
+        When(review_count__gt=0, then=Cast(F('rating_sum'), FloatField()) / F('review_count')),
+        default=0.0,
+        output_field=FloatField(),
+    )
+
+
+def get_leaderboard(limit=LEADERBOARD_SIZE):
+    """
+    Top couriers by average rating, then by number of reviews. The sorted
+    list is kept in the cache for LEADERBOARD_CACHE_TIMEOUT seconds and
+    rebuilt from the (-avg_rating, -review_count) index after a review
+    changes. limit is clamped to 1..LEADERBOARD_SIZE.
+    """
+    leaderboard = cache.get(LEADERBOARD_KEY)
+    if leaderboard is None:
+        leaderboard = [
+            {'courier': courier.pk, 'username': courier.user.username, 'first_name': courier.user.first_name,
+             'last_name': courier.user.last_name, 'avg_rating': round(courier.avg_rating, 1),
+             'review_count': courier.review_count}
+            for courier in Courier.objects.filter(review_count__gt=0).select_related('user')
+            .order_by('-avg_rating', '-review_count', 'id')[:LEADERBOARD_SIZE]
+        ]
+        cache.set(LEADERBOARD_KEY, leaderboard, settings.LEADERBOARD_CACHE_TIMEOUT)
+    return leaderboard[:max(1, min(limit, LEADERBOARD_SIZE))]
+
+
+def invalidate_leaderboard():
+    cache.delete(LEADERBOARD_KEY)
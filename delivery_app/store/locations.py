@@ -0,0 +1,147 @@
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from .geocoding import EARTH_RADIUS_KM
+from .models import Courier, CourierLocation
+from .tracking import publish_courier_position
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(courier_id):
+    return f'courier:location:{courier_id}'
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    # equirectangular approximation, exact enough for tens of metres
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS_KM * 1000
+
+
+class LocationIngestor:
+    """
+    Takes courier GPS pings without touching the database per ping. The
+    latest position of every courier is kept in memory. A trail point is
+    kept only if the courier moved min_meters or min_seconds passed since
+    the last kept one. On flush the trail is written with one bulk_create,
+    latest positions go to the cache and Courier rows with one bulk_update,
+    and clients tracking an order get the new position. With timer=True a
+    background thread also flushes every flush_interval, so the last pings
+    of a courier that went quiet do not wait for the next one.
+    """
+
+    def __init__(self, min_seconds, min_meters, flush_size, flush_interval, timer=False):
+        self.min_seconds = min_seconds
+        self.min_meters = min_meters
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._last_kept = {}
+        self._dirty = set()
+        self._trail = []
+        self._last_flush = time.monotonic()
+        self._timer = None if timer else False
+
+    def record(self, courier_id, latitude, longitude, timestamp=None):
+        """
+        Store one ping. Returns True when the caller should flush(). A
+        timestamp in the future is clamped to now, so it cannot pin the
+        courier's latest position and shadow every later ping.
+        """
+        now = time.time()
+        timestamp = now if timestamp is None else min(float(timestamp), now)
+        if not all(map(math.isfinite, (latitude, longitude, timestamp))):
+            raise ValueError('non-finite location')
+        self.start_timer()
+        with self._lock:
+            latest = self._latest.get(courier_id)
+            if latest is not None and latest[2] > timestamp:
+                return False
+            self._latest[courier_id] = (latitude, longitude, timestamp)
+            self._dirty.add(courier_id)
+
+            kept = self._last_kept.get(courier_id)
+            if (kept is None or timestamp - kept[2] >= self.min_seconds
+                    or distance_m(kept[0], kept[1], latitude, longitude) >= self.min_meters):
+                self._last_kept[courier_id] = (latitude, longitude, timestamp)
+                self._trail.append((courier_id, latitude, longitude, timestamp))
+            return self.should_flush()
+
+    def should_flush(self):
+        return (len(self._trail) >= self.flush_size
+                or (self._dirty and time.monotonic() - self._last_flush >= self.flush_interval))
+
+    def latest(self, courier_id):
+        position = self._latest.get(courier_id)
+        if position is None:
+            position = cache.get(cache_key(courier_id))
+        return position
+
+    def start_timer(self):
+        if self._timer is None:
+            with self._lock:
+                if self._timer is None:
+                    self._timer = threading.Thread(target=self._run_timer, name='location-flush', daemon=True)
+                    self._timer.start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._trail or self._dirty:
+                try:
+                    self.flush()
+                finally:
+                    connection.close()
+
+    def flush(self):
+        with self._lock:
+            trail, self._trail = self._trail, []
+            latest = {courier_id: self._latest[courier_id] for courier_id in self._dirty}
+            self._dirty = set()
+            self._last_flush = time.monotonic()
+        if not trail and not latest:
+            return 0
+        try:
+            couriers = self._write(trail, latest)
+        except Exception:
+            # put the batch back, the next flush retries it
+            logger.exception('Failed to flush %s courier locations', len(trail))
+            with self._lock:
+                self._trail[:0] = trail
+                self._dirty |= latest.keys()
+            return 0
+        for courier in couriers:
+            if courier.current_orders_id:
+                publish_courier_position(courier.current_orders_id, courier.latitude, courier.longitude)
+        return len(trail)
+
+    def _write(self, trail, latest):
+        CourierLocation.objects.bulk_create([
+            CourierLocation(courier_id=courier_id, latitude_e6=round(latitude * 1e6),
+                            longitude_e6=round(longitude * 1e6),
+                            recorded_date=datetime.fromtimestamp(timestamp, tz=dt_timezone.utc))
+            for courier_id, latitude, longitude, timestamp in trail
+        ], batch_size=1000)
+        cache.set_many({cache_key(courier_id): position for courier_id, position in latest.items()}, None)
+
+        couriers = list(Courier.objects.filter(pk__in=latest).only('id', 'current_orders_id'))
+        for courier in couriers:
+            courier.latitude, courier.longitude, _ = latest[courier.pk]
+        Courier.objects.bulk_update(couriers, ['latitude', 'longitude'], batch_size=1000)
+        return couriers
+
+
+ingestor = LocationIngestor(
+    min_seconds=getattr(settings, 'COURIER_TRAIL_MIN_SECONDS', 15),
+    min_meters=getattr(settings, 'COURIER_TRAIL_MIN_METERS', 50),
+    flush_size=getattr(settings, 'COURIER_LOCATION_FLUSH_SIZE', 500),
+    flush_interval=getattr(settings, 'COURIER_LOCATION_FLUSH_MS', 2000) / 1000,
+    timer=True,
+)
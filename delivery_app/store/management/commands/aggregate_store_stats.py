@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from store.analytics import aggregate_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Fold new orders and store reviews into the per-store daily rollups'
+
+    def handle(self, *args, **options):
+        processed = aggregate_daily_stats()
+        for name, count in processed.items():
+            self.stdout.write(f'{name}: {count} store-days updated')
@@ -0,0 +1,109 @@
+import asyncio
+import time
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from store.models import Cart, Category, Order, Product, Store, UserProfile
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/sec and p99 latency of the sync DRF read views with their async '
+            'counterparts, both driven through the Django ASGI application. '
+            'Runs against a throwaway test database, with the catalogue cache off unless --cached.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=200)
+        parser.add_argument('--products', type=int, default=10)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--cached', action='store_true',
+                            help='keep the catalogue cache on, i.e. time cache hits for the store views')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            if options['cached']:
+                self.run(options)
+            else:
+                with override_settings(CATALOGUE_CACHE_TIMEOUT=0):
+                    self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        owner = UserProfile.objects.create(username='bench_owner', user_role='владелец')
+        client = UserProfile.objects.create(username='bench_client', user_role='клиент')
+        category = Category.objects.create(category_name='bench')
+        stores = Store.objects.bulk_create([
+            Store(store_name=f'bench{i}', category=category, owner=owner, description='bench', address='bench')
+            for i in range(options['stores'])])
+        Product.objects.bulk_create([
+            Product(store=store, product_name=f'product{i}', price=100, description='bench')
+            for store in stores for i in range(options['products'])])
+        order = Order.objects.create(client=client, cart=Cart.objects.create(user=client), delivery_address='bench')
+        token = str(RefreshToken.for_user(client).access_token)
+
+        store = stores[-1].pk
+        pairs = [
+            ('store list', '/en/store/', '/en/async/store/'),
+            ('store detail', f'/en/store/{store}/', f'/en/async/store/{store}/'),
+            # ProductViewSet is not routed, so there is no sync baseline
+            ('product list', None, f'/en/async/product/?store={store}'),
+            ('order status', f'/en/order/{order.pk}/', f'/en/async/order/{order.pk}/status/'),
+        ]
+
+        app = get_asgi_application()
+        for name, sync_path, async_path in pairs:
+            for kind, path in (('sync', sync_path), ('async', async_path)):
+                if path is None:
+                    continue
+                timings, elapsed = asyncio.run(self.load(app, path, token, options))
+                timings.sort()
+                p99 = timings[max(int(len(timings) * 0.99) - 1, 0)]
+                self.stdout.write(f'{name:<13} {kind:<6} {len(timings) / elapsed:8.1f} req/s  '
+                                  f'p99 {p99 * 1000:.2f}ms')
+
+    async def load(self, app, path, token, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        timings = []
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                status = await self.request(app, path, token)
+                timings.append(time.perf_counter() - start)
+                assert status == 200, (path, status)
+
+        await self.request(app, path, token)
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(options['requests'])))
+        return timings, time.perf_counter() - start
+
+    async def request(self, app, path, token):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+        }
+        sent = False
+        status = None
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await app(scope, receive, send)
+        return status
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.urls import path
+from store.consumers import ChatConsumer
+from store.membership import chat_membership
+from store.models import UserProfile
+
+
+class BenchChatConsumer(ChatConsumer):
+    # measures the channel layer only, nothing is written to the database
+    async def save_message(self, message):
+        pass
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Simulate many ChatConsumer connections and measure throughput, fan-out latency and memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', action='append', choices=sorted(settings.CHANNEL_LAYER_BACKENDS),
+                            help='channel layer to test, can be repeated (default: memory)')
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--rooms', type=int, default=50)
+        parser.add_argument('--messages', type=int, default=20, help='messages sent per room')
+
+    def handle(self, *args, **options):
+        for backend in options['backend'] or ['memory']:
+            with override_settings(CHANNEL_LAYERS={'default': settings.CHANNEL_LAYER_BACKENDS[backend]}):
+                result = asyncio.run(self.run(options['connections'], options['rooms'], options['messages']))
+            self.stdout.write(
+                f"{backend}: {result['delivered']} messages in {result['elapsed']:.2f}s, "
+                f"{result['delivered'] / result['elapsed']:.0f} msg/s, "
+                f"latency p50 {result['p50'] * 1000:.2f}ms p95 {result['p95'] * 1000:.2f}ms "
+                f"p99 {result['p99'] * 1000:.2f}ms, {result['memory'] / 1024:.1f} KiB per connection"
+            )
+
+    async def run(self, connections, rooms, messages):
+        application = URLRouter([path('ws/chat/<str:room_name>/', BenchChatConsumer.as_asgi())])
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        communicators = []
+        for i in range(connections):
+            user = UserProfile(pk=i + 1, username=f'bench{i}')
+            chat_membership.set(i % rooms + 1, user.pk, True)
+            communicator = WebsocketCommunicator(application, f'/ws/chat/{i % rooms + 1}/')
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise RuntimeError('connection refused')
+            communicators.append(communicator)
+        memory = (tracemalloc.get_traced_memory()[0] - before) / connections
+        tracemalloc.stop()
+
+        members = {}
+        for i, communicator in enumerate(communicators):
+            members.setdefault(i % rooms, []).append(communicator)
+
+        latencies = []
+
+        async def listen(communicator, count):
+            for _ in range(count):
+                data = await communicator.receive_from(timeout=30)
+                latencies.append(time.perf_counter() - float(json.loads(data)['message']))
+
+        async def talk(room_members):
+            for _ in range(messages):
+                await room_members[0].send_to(text_data=json.dumps({'message': repr(time.perf_counter())}))
+                await asyncio.sleep(0)
+
+        start = time.perf_counter()
+        listeners = [listen(c, messages) for room_members in members.values() for c in room_members]
+        await asyncio.gather(*listeners, *(talk(room_members) for room_members in members.values()))
+        elapsed = time.perf_counter() - start
+
+        for communicator in communicators:
+            await communicator.disconnect()
+
+        return {
+            'delivered': len(latencies),
+            'elapsed': elapsed,
+            'p50': statistics.median(latencies) if latencies else 0,
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'memory': memory,
+        }
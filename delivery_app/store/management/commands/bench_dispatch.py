@@ -0,0 +1,63 @@
+import math
+import random
+import time
+from django.core.management.base import BaseCommand
+from store.dispatch import match_orders
+
+# Bishkek
+CITY_LATITUDE = 42.8746
+CITY_LONGITUDE = 74.5698
+
+
+def brute_force(orders, couriers):
+    free = {key: (lat, lon) for key, lat, lon in couriers}
+    assignments = []
+    for order_key, lat, lon in orders:
+        if not free:
+            break
+        courier_key = min(free, key=lambda key: math.hypot(free[key][0] - lat,
+                                                           (free[key][1] - lon) * math.cos(math.radians(lat))))
+        del free[courier_key]
+        assignments.append((order_key, courier_key))
+    return assignments
+
+
+class Command(BaseCommand):
+    help = 'Match orders to couriers in a synthetic city and compare the grid index with a linear scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--couriers', type=int, default=2000)
+        parser.add_argument('--radius-km', type=float, default=15.0)
+        parser.add_argument('--cell-km', type=float, default=1.0)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--no-brute-force', action='store_true')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        radius = options['radius_km'] / 111.32
+
+        def point():
+            # denser in the centre, like a real city
+            distance, angle = radius * math.sqrt(rng.random()) * rng.random(), rng.random() * 2 * math.pi
+            return (CITY_LATITUDE + distance * math.sin(angle),
+                    CITY_LONGITUDE + distance * math.cos(angle) / math.cos(math.radians(CITY_LATITUDE)))
+
+        orders = [(i, *point()) for i in range(options['orders'])]
+        couriers = [(i, *point()) for i in range(options['couriers'])]
+
+        start = time.perf_counter()
+        assignments = match_orders(orders, couriers, cell_km=options['cell_km'])
+        elapsed = time.perf_counter() - start
+        # throughput counts orders that got a courier, not every order offered
+        self.stdout.write(f'grid: {len(assignments)} assignments in {elapsed * 1000:.1f}ms, '
+                          f'{len(assignments) / elapsed * 60:.0f} orders/min')
+
+        if not options['no_brute_force']:
+            start = time.perf_counter()
+            expected = brute_force(orders, couriers)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'linear scan: {len(expected)} assignments in {elapsed * 1000:.1f}ms, '
+                              f'{len(expected) / elapsed * 60:.0f} orders/min')
+            same = sum(1 for a, b in zip(assignments, expected) if a == b)
+            self.stdout.write(f'identical assignments: {same}/{len(expected)}')
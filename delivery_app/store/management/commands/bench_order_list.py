@@ -0,0 +1,58 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIClient
+from store.models import Cart, Order, UserProfile
+
+
+class Command(BaseCommand):
+    help = ('Measure OrderViewSet list latency for one client while the total number of orders grows. '
+            'Runs against a throwaway test database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--own-orders', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=50)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        users = UserProfile.objects.bulk_create(
+            [UserProfile(username=f'bench{i}', user_role='клиент') for i in range(options['clients'])])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        me, my_cart = users[0], carts[0]
+        Order.objects.bulk_create([Order(client=me, cart=my_cart, delivery_address='bench')
+                                   for _ in range(options['own_orders'])])
+
+        client = APIClient()
+        client.force_authenticate(me)
+        total = options['own_orders']
+        for size in sorted(options['sizes']):
+            batch = []
+            while total < size:
+                index = total % (len(users) - 1) + 1
+                batch.append(Order(client=users[index], cart=carts[index], delivery_address='bench'))
+                total += 1
+                if len(batch) == 5000:
+                    Order.objects.bulk_create(batch)
+                    batch = []
+            Order.objects.bulk_create(batch)
+
+            timings = []
+            for _ in range(options['requests']):
+                start = time.perf_counter()
+                response = client.get('/en/order/')
+                timings.append(time.perf_counter() - start)
+                assert response.status_code == 200
+            timings.sort()
+            self.stdout.write(f'{total} orders: {len(response.json()["results"])} rows, '
+                              f'median {statistics.median(timings) * 1000:.2f}ms, '
+                              f'p95 {timings[int(len(timings) * 0.95) - 1] * 1000:.2f}ms')
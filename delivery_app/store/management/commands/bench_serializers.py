@@ -0,0 +1,74 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone, translation
+from rest_framework.renderers import JSONRenderer
+from store.fastpath import FastJSONRenderer, orjson
+from store.models import Category, CourierReview, Product, Store, UserProfile
+from store.prefetch import plan_queryset
+from store.serializers import (CourierReviewSerializer, ProductSerializer, StoreListSerializer,
+                               fast_courier_review, fast_product, fast_store_list)
+
+
+class Command(BaseCommand):
+    help = ('Measure rows/sec of the DRF list serializers against their compiled fast path, '
+            'from query to rendered JSON. Runs against a throwaway test database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with translation.override('ru'):
+                self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        rows = options['rows']
+        owner = UserProfile.objects.create(username='bench_owner', user_role='владелец', first_name='Бенч')
+        client = UserProfile.objects.create(username='bench_client', user_role='клиент')
+        category = Category.objects.create(category_name_en='bench', category_name_ru='бенч')
+        stores = Store.objects.bulk_create([
+            Store(store_name_en=f'bench{i}', store_name_ru=f'бенч{i}', store_image='store_images/bench.png',
+                  category=category, owner=owner, description='bench', address='bench',
+                  rating_sum=i % 50, review_count=i % 10, good_grade_count=i % 7)
+            for i in range(rows)])
+        Product.objects.bulk_create([
+            Product(store=stores[i % len(stores)], product_name_en=f'product{i}', product_name_ru=f'продукт{i}',
+                    product_image='product_images/bench.png', price=i, description='bench')
+            for i in range(rows)])
+        now = timezone.now()
+        CourierReview.objects.bulk_create([
+            CourierReview(client=client, courier=owner, rating=i % 5 + 1, created_date=now) for i in range(rows)])
+
+        request = RequestFactory().get('/')
+        self.stdout.write(f'encoder: {"orjson" if orjson else "json (orjson not installed)"}')
+        for name, serializer_class, fast, model in (
+                ('StoreListSerializer', StoreListSerializer, fast_store_list, Store),
+                ('ProductSerializer', ProductSerializer, fast_product, Product),
+                ('CourierReviewSerializer', CourierReviewSerializer, fast_courier_review, CourierReview)):
+            def drf():
+                queryset = plan_queryset(model.objects.all(), serializer_class)
+                data = serializer_class(queryset, many=True, context={'request': request}).data
+                return JSONRenderer().render(data)
+
+            def compiled():
+                return FastJSONRenderer().render(fast.serialize(fast.rows(model.objects.all()), request))
+
+            assert drf() == compiled(), name
+            before, after = self.best(drf, options), self.best(compiled, options)
+            self.stdout.write(f'{name:<24} drf {rows / before:10.0f} rows/s  '
+                              f'fast {rows / after:10.0f} rows/s  x{before / after:.1f}')
+
+    def best(self, function, options):
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from store.dispatch import dispatch_pending_orders
+
+
+class Command(BaseCommand):
+    help = 'Assign pending orders to the nearest available couriers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--cell-km', type=float, default=1.0)
+        parser.add_argument('--max-km', type=float, default=None)
+        parser.add_argument('--loop', type=float, default=None, help='repeat every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            assignments = dispatch_pending_orders(batch_size=options['batch_size'], cell_km=options['cell_km'],
+                                                  max_km=options['max_km'])
+            self.stdout.write(f'Assigned {len(assignments)} orders')
+            if options['loop'] is None:
+                break
+            if len(assignments) < options['batch_size']:
+                time.sleep(options['loop'])
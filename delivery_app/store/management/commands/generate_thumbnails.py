@@ -0,0 +1,30 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from store.imaging import render_variants
+from store.thumbnails import IMAGE_FIELDS, get_sizes, hash_field, store_digest
+
+
+class Command(BaseCommand):
+    help = 'Render thumbnails for store, product and combo images that have none yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'THUMBNAIL_WORKERS', 2) or 1)
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for model, field in IMAGE_FIELDS.items():
+                rows = (model.objects.filter(**{hash_field(model): ''}).exclude(**{field: ''})
+                        .values_list('pk', field).order_by('pk'))
+                futures = [(pk, name, pool.submit(render_variants, default_storage.path(name),
+                                                  settings.MEDIA_ROOT, get_sizes()))
+                           for pk, name in rows]
+                done = 0
+                for pk, name, future in futures:
+                    try:
+                        store_digest(model, pk, name, future.result())
+                        done += 1
+                    except OSError as e:
+                        self.stderr.write(f'{model.__name__} {pk}: {e}')
+                self.stdout.write(f'{model.__name__}: {done} of {len(futures)} images')
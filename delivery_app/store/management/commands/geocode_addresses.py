@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from store.geocoding import GeocodeError, geocode, normalize_address
+from store.models import Order, Store
+
+
+class Command(BaseCommand):
+    help = 'Fill latitude/longitude of stores and orders that have none'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        points = {}
+        for model, address_field in ((Store, 'address'), (Order, 'delivery_address')):
+            filled = self.backfill(model, address_field, points, options['batch_size'])
+            self.stdout.write(f'{model.__name__}: {filled} geocoded')
+        self.stdout.write(self.style.SUCCESS(f'{len(points)} distinct addresses'))
+
+    def backfill(self, model, address_field, points, batch_size):
+        queryset = model.objects.filter(latitude__isnull=True).only('id', address_field).order_by('id')
+        filled, last_id = 0, 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                return filled
+            last_id = batch[-1].pk
+            changed = []
+            for instance in batch:
+                address = normalize_address(getattr(instance, address_field) or '')
+                if address not in points:
+                    try:
+                        points[address] = geocode(address)
+                    except GeocodeError as e:
+                        self.stderr.write(f'{model.__name__} {instance.pk}: {e}')
+                        continue
+                if points[address] is not None:
+                    instance.latitude, instance.longitude = points[address]
+                    changed.append(instance)
+            model.objects.bulk_update(changed, ['latitude', 'longitude'])
+            filled += len(changed)
@@ -0,0 +1,15 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from store.uploads import purge_uploads
+
+
+class Command(BaseCommand):
+    help = ('Delete chat uploads that were started but not finished within --hours, '
+            'and part files no upload refers to any more')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        uploads, files = purge_uploads(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'{uploads} unfinished uploads and {files} orphaned files removed'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from store.leaderboard import avg_rating_expression, invalidate_leaderboard
+from store.models import Courier, CourierReview
+
+
+class Command(BaseCommand):
+    help = 'Recalculate rating_sum, review_count and avg_rating of every courier from CourierReview'
+
+    def handle(self, *args, **options):
+        reviews = CourierReview.objects.filter(courier_id=OuterRef('user_id')).order_by().values('courier_id')
+        with transaction.atomic():
+            updated = Courier.objects.update(
+                rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total'),
+                                             output_field=IntegerField()), 0),
+                review_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total'),
+                                               output_field=IntegerField()), 0),
+            )
+            Courier.objects.update(avg_rating=avg_rating_expression())
+        invalidate_leaderboard()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings for {updated} couriers'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from store.cache import invalidate_catalogue
+from store.models import Store, StoreReview
+
+
+class Command(BaseCommand):
+    help = 'Recalculate rating_sum, review_count and good_grade_count of every store from StoreReview'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        stores = Store.objects.annotate(
+            new_rating_sum=Coalesce(Sum('store_reviews__rating'), 0),
+            new_review_count=Count('store_reviews'),
+            new_good_grade_count=Count('store_reviews',
+                                       filter=Q(store_reviews__rating__gt=StoreReview.GOOD_GRADE)),
+        ).only('id').order_by('id')
+
+        changed = []
+        updated = 0
+        with transaction.atomic():
+            for store in stores.iterator(chunk_size=batch_size):
+                store.rating_sum = store.new_rating_sum
+                store.review_count = store.new_review_count
+                store.good_grade_count = store.new_good_grade_count
+                changed.append(store)
+                if len(changed) >= batch_size:
+                    Store.objects.bulk_update(changed, ['rating_sum', 'review_count', 'good_grade_count'])
+                    updated += len(changed)
+                    changed = []
+            if changed:
+                Store.objects.bulk_update(changed, ['rating_sum', 'review_count', 'good_grade_count'])
+                updated += len(changed)
+            # bulk_update sends no signals, so cached store lists would keep the old ratings
+            invalidate_catalogue()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings for {updated} stores'))
@@ -0,0 +1,63 @@
+import asyncio
+import time
+from channels.db import database_sync_to_async
+from django.conf import settings
+from .models import Chat
+
+
+class ChatMembershipCache:
+    """
+    TTL cache of (chat_id, user_id) -> is member. Concurrent lookups of the
+    same key share one database query, so a reconnect storm costs at most
+    one query per member per ttl seconds.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._pending = {}
+
+    async def is_member(self, chat_id, user_id):
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._load(chat_id, user_id))
+            self._pending[key] = future
+            future.add_done_callback(lambda f: self._pending.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _load(self, chat_id, user_id):
+        result = await database_sync_to_async(self._query)(chat_id, user_id)
+        self.set(chat_id, user_id, result)
+        return result
+
+    @staticmethod
+    def _query(chat_id, user_id):
+        return Chat.person.through.objects.filter(chat_id=chat_id, userprofile_id=user_id).exists()
+
+    def set(self, chat_id, user_id, value):
+        self._entries[(chat_id, user_id)] = (time.monotonic() + self.ttl, value)
+        if len(self._entries) > getattr(settings, 'CHAT_MEMBERSHIP_CACHE_SIZE', 100000):
+            self.purge()
+
+    def purge(self):
+        now = time.monotonic()
+        self._entries = {key: entry for key, entry in self._entries.items() if entry[0] > now}
+        if len(self._entries) > getattr(settings, 'CHAT_MEMBERSHIP_CACHE_SIZE', 100000):
+            self._entries = {}
+
+    def invalidate(self, chat_id=None, user_ids=None):
+        if chat_id is None:
+            self._entries = {}
+        elif user_ids is None:
+            self._entries = {key: entry for key, entry in self._entries.items() if key[0] != chat_id}
+        else:
+            for user_id in user_ids:
+                self._entries.pop((chat_id, user_id), None)
+
+
+chat_membership = ChatMembershipCache(ttl=getattr(settings, 'CHAT_MEMBERSHIP_TTL', 60))
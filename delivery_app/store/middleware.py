@@ -0,0 +1,41 @@
+from urllib.parse import parse_qs
+from channels.auth import AuthMiddlewareStack
+from channels.middleware import BaseMiddleware
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+
+def get_raw_token(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('token'):
+        return query['token'][0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode().split()
+            if len(parts) == 2 and parts[0] == 'Bearer':
+                return parts[1]
+    return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Sets scope['user'] from a SimpleJWT access token passed as ?token=...
+    or an 'Authorization: Bearer ...' header. The user is built from the
+    token claims (TokenUser), so the handshake does not touch the database.
+    """
+    authentication = JWTStatelessUserAuthentication()
+
+    async def __call__(self, scope, receive, send):
+        raw_token = get_raw_token(scope)
+        if raw_token:
+            scope = dict(scope)
+            try:
+                validated_token = self.authentication.get_validated_token(raw_token)
+                scope['user'] = self.authentication.get_user(validated_token)
+            except (InvalidToken, TokenError):
+                pass
+        return await super().__call__(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
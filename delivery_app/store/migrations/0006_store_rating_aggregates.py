@@ -0,0 +1,45 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:24
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Store = apps.get_model('store', 'Store')
+    stores = Store.objects.annotate(
+        new_rating_sum=Coalesce(Sum('store_reviews__rating'), 0),
+        new_review_count=Count('store_reviews'),
+        new_good_grade_count=Count('store_reviews', filter=Q(store_reviews__rating__gt=3)),
+    )
+    for store in stores:
+        store.rating_sum = store.new_rating_sum
+        store.review_count = store.new_review_count
+        store.good_grade_count = store.new_good_grade_count
+    Store.objects.bulk_update(stores, ['rating_sum', 'review_count', 'good_grade_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_rename_massage_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='store',
+            name='good_grade_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_store_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='courierreview',
+            index=models.Index(fields=['-created_date', '-id'], name='store_couri_created_f0a936_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_date', '-id'], name='store_order_created_9ccfe7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storereview',
+            index=models.Index(fields=['-created_date', '-id'], name='store_store_created_bd2f21_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_store_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='store',
+            index=models.Index(fields=['latitude', 'longitude'], name='store_store_latitud_1d02d3_idx'),
+        ),
+    ]
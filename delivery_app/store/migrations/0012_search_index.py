@@ -0,0 +1,87 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SQLITE_SQL = [
+    "CREATE VIRTUAL TABLE store_searchdocument_fts USING fts5("
+    "name_en, name_ru, description, content='store_searchdocument', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER store_searchdocument_ai AFTER INSERT ON store_searchdocument BEGIN "
+    "INSERT INTO store_searchdocument_fts(rowid, name_en, name_ru, description) "
+    "VALUES (new.id, new.name_en, new.name_ru, new.description); END",
+    "CREATE TRIGGER store_searchdocument_ad AFTER DELETE ON store_searchdocument BEGIN "
+    "INSERT INTO store_searchdocument_fts(store_searchdocument_fts, rowid, name_en, name_ru, description) "
+    "VALUES ('delete', old.id, old.name_en, old.name_ru, old.description); END",
+    "CREATE TRIGGER store_searchdocument_au AFTER UPDATE ON store_searchdocument BEGIN "
+    "INSERT INTO store_searchdocument_fts(store_searchdocument_fts, rowid, name_en, name_ru, description) "
+    "VALUES ('delete', old.id, old.name_en, old.name_ru, old.description); "
+    "INSERT INTO store_searchdocument_fts(rowid, name_en, name_ru, description) "
+    "VALUES (new.id, new.name_en, new.name_ru, new.description); END",
+]
+SQLITE_REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS store_searchdocument_ai",
+    "DROP TRIGGER IF EXISTS store_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS store_searchdocument_au",
+    "DROP TABLE IF EXISTS store_searchdocument_fts",
+]
+POSTGRESQL_SQL = [
+    "ALTER TABLE store_searchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(name_en, '') || ' ' || coalesce(name_ru, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')) STORED",
+    "CREATE INDEX store_searchdocument_vector_idx ON store_searchdocument USING GIN (search_vector)",
+]
+POSTGRESQL_REVERSE_SQL = [
+    "DROP INDEX IF EXISTS store_searchdocument_vector_idx",
+    "ALTER TABLE store_searchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run_sql(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+def fill_search_index(apps, schema_editor):
+    SearchDocument = apps.get_model('store', 'SearchDocument')
+    documents = []
+    for kind, model_name, name_field in (('store', 'Store', 'store_name'), ('product', 'Product', 'product_name'),
+                                         ('combo', 'ProductCombo', 'combo_name')):
+        for obj in apps.get_model('store', model_name).objects.all():
+            documents.append(SearchDocument(
+                kind=kind, object_id=obj.pk, store_id=obj.pk if kind == 'store' else obj.store_id,
+                name_en=getattr(obj, f'{name_field}_en') or '', name_ru=getattr(obj, f'{name_field}_ru') or '',
+                description=' '.join(filter(None, [obj.description_en, obj.description_ru])),
+            ))
+    SearchDocument.objects.bulk_create(documents, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_store_location_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('store', 'store'), ('product', 'product'), ('combo', 'combo')], max_length=16)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('name_en', models.CharField(blank=True, max_length=32)),
+                ('name_ru', models.CharField(blank=True, max_length=32)),
+                ('description', models.TextField(blank=True)),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to='store.store')),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(run_sql({'sqlite': SQLITE_SQL, 'postgresql': POSTGRESQL_SQL}),
+                             run_sql({'sqlite': SQLITE_REVERSE_SQL, 'postgresql': POSTGRESQL_REVERSE_SQL})),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
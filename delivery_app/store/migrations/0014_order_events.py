@@ -0,0 +1,29 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_checkout_order_items'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(choices=[('ожидает обработки', 'Ожидает обработки'), ('в процессе доставки', 'в процессе доставки'), ('доставлен', 'Доставлен'), ('отменен', 'Отменен')], max_length=64)),
+                ('to_status', models.CharField(choices=[('ожидает обработки', 'Ожидает обработки'), ('в процессе доставки', 'в процессе доставки'), ('доставлен', 'Доставлен'), ('отменен', 'Отменен')], max_length=64)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='store.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'created_date'], name='store_order_order_i_150a23_idx')],
+            },
+        ),
+    ]
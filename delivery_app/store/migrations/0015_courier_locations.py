@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_order_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourierLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude_e6', models.IntegerField()),
+                ('longitude_e6', models.IntegerField()),
+                ('recorded_date', models.DateTimeField()),
+                ('courier', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='locations', to='store.courier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['courier', 'recorded_date'], name='store_couri_courier_5139d5_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:39
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_courier_ratings(apps, schema_editor):
+    Courier = apps.get_model('store', 'Courier')
+    CourierReview = apps.get_model('store', 'CourierReview')
+    totals = {row['courier_id']: row for row in
+              CourierReview.objects.values('courier_id').annotate(total=Sum('rating'), count=Count('id'))}
+    couriers = list(Courier.objects.filter(user_id__in=totals))
+    for courier in couriers:
+        row = totals[courier.user_id]
+        courier.rating_sum, courier.review_count = row['total'], row['count']
+        courier.avg_rating = row['total'] / row['count']
+    Courier.objects.bulk_update(couriers, ['rating_sum', 'review_count', 'avg_rating'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_courier_locations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courier',
+            name='avg_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courier',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courier',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='courier',
+            index=models.Index(fields=['-avg_rating', '-review_count'], name='store_couri_avg_rat_30e50d_idx'),
+        ),
+        migrations.RunPython(fill_courier_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_order_item_stores(apps, schema_editor):
+    OrderItem = apps.get_model('store', 'OrderItem')
+    Product = apps.get_model('store', 'Product')
+    OrderItem.objects.filter(product__isnull=False).update(
+        store_id=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('store_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_upload_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='store',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='store.store'),
+        ),
+        migrations.RunPython(fill_order_item_stores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_order_item_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storereview',
+            name='added_date',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -1,5 +1,7 @@
+import uuid
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import F, Sum
 from phonenumber_field.formfields import PhoneNumberField
 
 
@@ -27,36 +29,37 @@ class Category(models.Model):
 class Store(models.Model):
     store_name = models.CharField(max_length=32)
     store_image = models.ImageField(upload_to='store_images/')
+    store_image_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     description = models.TextField()
     address = models.CharField(max_length=32)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     owner = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
+    # kept in sync by store/signals.py, rebuilt with `manage.py rebuild_store_ratings`
+    rating_sum = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    good_grade_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['latitude', 'longitude'])]
 
     def __str__(self):
         return f'{self.store_name} - {self.address}'
 
     def get_avg_rating(self):
-        ratings = self.store_reviews.all()
-        if ratings.exists():
-            return round(sum(i.rating for i in ratings) / ratings.count(), 1)
+        if self.review_count:
+            return round(self.rating_sum / self.review_count, 1)
         return 0
 
     def get_count_people(self):
-        total = self.store_reviews.all()
-        if total.exists():
-            if total .count() > 3:
-                return '3+'
-            return total.count()
-        return 0
+        if self.review_count > 3:
+            return '3+'
+        return self.review_count
 
     def get_count_good_grade(self):
-        total = self.store_reviews.all()
-        if total.exists():
-            num = 0
-            for i in total:
-                if i.rating > 3:
-                    num += 1
-            return f'{round((num * 100) / total.count())}%'
+        if self.review_count:
+            return f'{round((self.good_grade_count * 100) / self.review_count)}%'
         return '0%'
 
 
@@ -66,10 +69,21 @@ class StoreReview(models.Model):
     rating = models.IntegerField(choices=[(i, str(i))for i in range(1, 6)])
     comment = models.TextField()
     created_date = models.DateTimeField()
+    # when the row was inserted; created_date is user-editable, so the
+    # analytics lag window (analytics.py) is measured on this instead
+    added_date = models.DateTimeField(auto_now_add=True)
+
+    GOOD_GRADE = 3
+
+    class Meta:
+        indexes = [models.Index(fields=['-created_date', '-id'])]
 
     def __str__(self):
         return f'{self.client} - {self.store} - {self.rating}'
 
+    def is_good_grade(self):
+        return self.rating > self.GOOD_GRADE
+
 
 class ContactInfo(models.Model):
     contact_info = PhoneNumberField()
@@ -82,6 +96,7 @@ class ContactInfo(models.Model):
 class Product(models.Model):
     product_name = models.CharField(max_length=32)
     product_image = models.ImageField(upload_to='product_images')
+    product_image_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     description = models.TextField()
     price = models.PositiveIntegerField()
     store = models.ForeignKey(Store, related_name='products', on_delete=models.CASCADE)
@@ -94,6 +109,7 @@ class Product(models.Model):
 class ProductCombo(models.Model):
     combo_name = models.CharField(max_length=32)
     combo_image = models.ImageField(upload_to='product_images')
+    combo_image_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     description = models.TextField()
     price = models.PositiveIntegerField()
     store = models.ForeignKey(Store, related_name='combos', on_delete=models.CASCADE)
@@ -109,8 +125,8 @@ class Cart(models.Model):
         return f'{self.user}'
 
     def get_total_price(self):
-        total_price = sum(item.get_total_price() for item in self.items.all())
-        return total_price
+        total_price = self.items.aggregate(total=Sum(F('quantity') * F('product__price')))['total']
+        return total_price or 0
 
 
 class CarItem(models.Model):
@@ -121,6 +137,9 @@ class CarItem(models.Model):
     def __str__(self):
         return f'{self.product} - {self.quantity}'
 
+    def get_total_price(self):
+        return self.product.price * self.quantity
+
 
 class Order(models.Model):
     client = models.ForeignKey(UserProfile, related_name='order_client',  on_delete=models.CASCADE)
@@ -134,32 +153,100 @@ class Order(models.Model):
 
     status = models.CharField(max_length=64, choices=STATUS_CHOICES, default='ожидает обработки')
     delivery_address = models.CharField(max_length=64)
-    courier = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='courier_orders')
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    courier = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='courier_orders',
+                                null=True, blank=True)
+    total_price = models.PositiveIntegerField(default=0)
     created_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_date', '-id']),
+            models.Index(fields=['status', 'created_date']),
+            models.Index(fields=['client', 'created_date']),
+            models.Index(fields=['courier', 'status']),
+        ]
+
     def __str__(self):
         return f'{self.client} - {self.status} - {self.courier}'
 
 
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
+    # the product's store at checkout, kept when the product is deleted
+    store = models.ForeignKey(Store, on_delete=models.SET_NULL, null=True, blank=True)
+    product_name = models.CharField(max_length=32)
+    price = models.PositiveIntegerField()
+    quantity = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f'{self.product_name} - {self.quantity}'
+
+    def get_total_price(self):
+        return self.price * self.quantity
+
+
+class OrderEvent(models.Model):
+    order = models.ForeignKey(Order, related_name='events', on_delete=models.CASCADE)
+    from_status = models.CharField(max_length=64, choices=Order.STATUS_CHOICES)
+    to_status = models.CharField(max_length=64, choices=Order.STATUS_CHOICES)
+    actor = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True, blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['order', 'created_date'])]
+
+    def __str__(self):
+        return f'{self.order_id} - {self.from_status} - {self.to_status}'
+
+
 class Courier(models.Model):
     user = models.ForeignKey(UserProfile, related_name='courier', on_delete=models.CASCADE)
-    current_orders = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='orders')
+    current_orders = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='orders', null=True, blank=True)
     TYPE_STATUS_CHOICES = (
         ('занят', 'занят'),
         ('доступен', 'доступен'),
     )
     status = models.CharField(max_length=32, choices=TYPE_STATUS_CHOICES)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # kept in sync by store/signals.py, rebuilt with `manage.py rebuild_courier_ratings`
+    rating_sum = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    avg_rating = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['-avg_rating', '-review_count'])]
 
     def __str__(self):
         return f'{self.user} - {self.status}'
 
 
+class CourierLocation(models.Model):
+    # append-only trail, coordinates in millionths of a degree
+    courier = models.ForeignKey(Courier, related_name='locations', on_delete=models.CASCADE, db_index=False)
+    latitude_e6 = models.IntegerField()
+    longitude_e6 = models.IntegerField()
+    recorded_date = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['courier', 'recorded_date'])]
+
+    def __str__(self):
+        return f'{self.courier_id} - {self.recorded_date}'
+
+
 class CourierReview(models.Model):
     client = models.ForeignKey(UserProfile, related_name='client_review', on_delete=models.CASCADE)
     courier = models.ForeignKey(UserProfile, related_name='courier_review', on_delete=models.CASCADE)
     rating = models.IntegerField(choices=[(i, str(i)) for i in range(1, 6)])
     created_date = models.DateTimeField()
 
+    class Meta:
+        indexes = [models.Index(fields=['-created_date', '-id'])]
+
     def __str__(self):
         return f'{self.rating} - {self.courier}'
 
@@ -175,12 +262,75 @@ class Message(models.Model):
     text = models.TextField()
     image = models.ImageField(upload_to='images', null=True, blank=True)
     video = models.FileField(upload_to='videos', null=True, blank=True)
-    created_date = models.DateTimeField(auto_now=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['chat', '-created_date', '-id'])]
+
+    def __str__(self):
+        return f'{self.author} - {self.chat_id}'
+
+
+class ChunkedUpload(models.Model):
+    KIND_CHOICES = (
+        ('image', 'image'),
+        ('video', 'video'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE)
+    author = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    filename = models.CharField(max_length=128)
+    text = models.TextField(blank=True)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    # set while a request is writing the chunk at offset
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    message = models.OneToOneField(Message, null=True, blank=True, on_delete=models.SET_NULL)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.author} - {self.filename} - {self.offset}/{self.size}'
+
 
+class StoreDailyStats(models.Model):
+    store = models.ForeignKey(Store, related_name='daily_stats', on_delete=models.CASCADE)
+    date = models.DateField()
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.PositiveBigIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        unique_together = [('store', 'date')]
 
+    def __str__(self):
+        return f'{self.store_id} - {self.date}'
+
+
+class AggregationWatermark(models.Model):
+    name = models.CharField(max_length=32, unique=True)
+    last_id = models.BigIntegerField(default=0)
 
+    def __str__(self):
+        return f'{self.name} - {self.last_id}'
 
 
+class SearchDocument(models.Model):
+    KIND_CHOICES = (
+        ('store', 'store'),
+        ('product', 'product'),
+        ('combo', 'combo'),
+    )
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='search_documents')
+    name_en = models.CharField(max_length=32, blank=True)
+    name_ru = models.CharField(max_length=32, blank=True)
+    description = models.TextField(blank=True)
 
+    class Meta:
+        unique_together = [('kind', 'object_id')]
 
+    def __str__(self):
+        return f'{self.kind} - {self.object_id}'
@@ -0,0 +1,75 @@
+from django.db import transaction
+from .models import Courier, Order, OrderEvent
+
+PENDING = 'ожидает обработки'
+IN_DELIVERY = 'в процессе доставки'
+DELIVERED = 'доставлен'
+CANCELLED = 'отменен'
+FINAL = {DELIVERED, CANCELLED}
+
+COURIER_FREE = 'доступен'
+COURIER_BUSY = 'занят'
+
+TRANSITIONS = {
+    PENDING: {IN_DELIVERY, CANCELLED},
+    IN_DELIVERY: {DELIVERED, CANCELLED},
+    DELIVERED: set(),
+    CANCELLED: set(),
+}
+
+
+class TransitionError(Exception):
+    pass
+
+
+class TransitionConflict(TransitionError):
+    pass
+
+
+class TransitionForbidden(TransitionError):
+    pass
+
+
+def can_transition(from_status, to_status):
+    return to_status in TRANSITIONS.get(from_status, ())
+
+
+def check_actor(actor, order, from_status, to_status):
+    """
+    Role rules on top of TRANSITIONS. Pending -> in delivery is left to
+    the dispatcher, which also assigns the courier. A courier may only
+    deliver their own order, a client may only cancel their own order
+    while it is still pending. Staff may deliver or cancel any order.
+    """
+    if from_status == PENDING and to_status == IN_DELIVERY:
+        allowed = False
+    elif actor.is_staff:
+        allowed = True
+    elif actor.user_role == 'курьер':
+        allowed = (from_status, to_status) == (IN_DELIVERY, DELIVERED) and order.courier_id == actor.pk
+    elif actor.user_role == 'клиент':
+        allowed = (from_status, to_status) == (PENDING, CANCELLED) and order.client_id == actor.pk
+    else:
+        allowed = False
+    if not allowed:
+        raise TransitionForbidden(f'Недостаточно прав, чтобы перевести заказ в "{to_status}"')
+
+
+def transition(order_id, expected_status, new_status, actor=None, **fields):
+    """
+    Move an order from expected_status to new_status with a conditional
+    UPDATE ... WHERE status = expected_status and log an OrderEvent. No row
+    is locked up front; if someone else changed the status first, nothing
+    is updated and TransitionConflict is raised. A delivered or cancelled
+    order frees its courier in the same transaction.
+    """
+    if not can_transition(expected_status, new_status):
+        raise TransitionError(f'Нельзя перевести заказ из "{expected_status}" в "{new_status}"')
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order_id, status=expected_status).update(status=new_status, **fields)
+        if not updated:
+            raise TransitionConflict('Статус заказа уже изменился')
+        if new_status in FINAL:
+            Courier.objects.filter(current_orders_id=order_id).update(current_orders=None, status=COURIER_FREE)
+        return OrderEvent.objects.create(order_id=order_id, from_status=expected_status, to_status=new_status,
+                                         actor=actor)
@@ -0,0 +1,61 @@
+from django.db.models import CharField, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.utils.translation import get_language
+from modeltranslation.utils import build_localized_fieldname, resolution_order
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination
+from .fastpath import translated_fields
+from .search import SEARCH_RANK
+
+
+class IdCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        # ranked ?search= results keep their rank unless ?ordering= is given
+        if SEARCH_RANK in queryset.query.annotations and not request.query_params.get(OrderingFilter.ordering_param):
+            return (SEARCH_RANK,)
+        return super().get_ordering(request, queryset, view)
+
+
+class CreatedDateCursorPagination(IdCursorPagination):
+    ordering = ('-created_date', '-id')
+
+
+class MessageCursorPagination(CreatedDateCursorPagination):
+    page_size = 50
+
+
+class CursorOrderingFilter(OrderingFilter):
+    """
+    ?ordering= that cursor pagination can page through. A translated field
+    sorts by '<field>_sort', the value it resolves to in the current
+    language (with modeltranslation's fallbacks, never NULL), and every
+    ordering ends with id, so no two rows share a cursor position.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        translated = translated_fields(queryset.model)
+        ordering = [f'{field}_sort' if field.lstrip('-') in translated else field for field in ordering]
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return ordering
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if not ordering:
+            return queryset
+        names = {name.lstrip('-') for name in ordering}
+        languages = resolution_order(get_language())
+        sort_keys = {}
+        for field in translated_fields(queryset.model):
+            if f'{field}_sort' in names:
+                localized = [NullIf(build_localized_fieldname(field, language), Value('')) for language in languages]
+                sort_keys[f'{field}_sort'] = Coalesce(*localized, Value(''), output_field=CharField())
+        return queryset.annotate(**sort_keys).order_by(*ordering)
@@ -1,5 +1,5 @@
 from rest_framework import permissions
-from .models import Store
+from .models import Store, Chat
 
 
 #только владелец гана озгорто алат башкалар только окуйт
@@ -33,15 +33,16 @@ class CheckCourier(permissions.BasePermission):
 class CheckOrder(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.user.user_role == 'владелец':
-            return False
+            return request.method in permissions.SAFE_METHODS
         return True
 
 
+#владелец озунун магазининдеги заказдарды гана корот (OrderViewSet.get_queryset)
 class CheckOrderUser(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        if request.user == obj.order_client:
+        if request.user.is_staff or request.user.pk in (obj.client_id, obj.courier_id):
             return True
-        return False
+        return request.user.user_role == 'владелец' and request.method in permissions.SAFE_METHODS
 
 
 class CheckCRUD(permissions.BasePermission):
@@ -57,3 +58,36 @@ class CheckReview(permissions.BasePermission):
             return True
         return False
 
+
+class CheckCourierRole(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.user_role == 'курьер'
+
+
+class CheckCourierAccess(permissions.BasePermission):
+    """
+    Couriers edit only their own profile and staff everything; a location
+    is readable by the courier, staff and the client of the courier's
+    current order. Positions themselves only change through post_location.
+    """
+    def has_permission(self, request, view):
+        if not request.user.is_authenticated:
+            return False
+        if request.method in permissions.SAFE_METHODS or request.user.is_staff:
+            return True
+        return request.user.user_role == 'курьер'
+
+    def has_object_permission(self, request, view, obj):
+        if request.user.is_staff or obj.user_id == request.user.pk:
+            return True
+        return (request.method in permissions.SAFE_METHODS and obj.current_orders_id is not None
+                and obj.current_orders.client_id == request.user.pk)
+
+
+class CheckChatMember(permissions.BasePermission):
+    def has_permission(self, request, view):
+        if not request.user.is_authenticated:
+            return False
+        return Chat.person.through.objects.filter(chat_id=view.kwargs['chat_id'],
+                                                  userprofile_id=request.user.pk).exists()
+
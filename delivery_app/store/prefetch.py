@@ -0,0 +1,83 @@
+from functools import lru_cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def _unwrap(field):
+    if isinstance(field, serializers.ListSerializer):
+        return field.child, True
+    if isinstance(field, serializers.ManyRelatedField):
+        return None, True
+    if isinstance(field, serializers.BaseSerializer):
+        return field, False
+    return None, False
+
+
+def _get_relation(model, source):
+    try:
+        relation = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    if not relation.is_relation:
+        return None
+    return relation
+
+
+@lru_cache(maxsize=None)
+def build_plan(model, serializer_class):
+    """
+    Walk the fields of serializer_class and return the tuple
+    (select_related paths, ((prefetch path, related model, nested plan), ...)).
+    """
+    select, prefetch = [], []
+    _collect(model, serializer_class(), '', select, prefetch)
+    return tuple(select), tuple(prefetch)
+
+
+def _collect(model, serializer, prefix, select, prefetch):
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        nested, many = _unwrap(field)
+        if nested is None and not many:
+            continue
+        source = field.source.split('.')[0]
+        relation = _get_relation(model, source)
+        if relation is None:
+            continue
+        path = prefix + source
+        related_model = relation.related_model
+        if relation.many_to_one or relation.one_to_one:
+            if nested is None:
+                continue
+            select.append(path)
+            _collect(related_model, nested, path + '__', select, prefetch)
+        else:
+            nested_plan = build_plan(related_model, type(nested)) if nested is not None else ((), ())
+            prefetch.append((path, related_model, nested_plan))
+
+
+def apply_plan(queryset, plan):
+    select, prefetch = plan
+    if select:
+        queryset = queryset.select_related(*select)
+    lookups = [Prefetch(path, queryset=apply_plan(related_model._default_manager.all(), nested_plan))
+               for path, related_model, nested_plan in prefetch]
+    if lookups:
+        queryset = queryset.prefetch_related(*lookups)
+    return queryset
+
+
+def plan_queryset(queryset, serializer_class):
+    return apply_plan(queryset, build_plan(queryset.model, serializer_class))
+
+
+class PrefetchPlanMixin:
+    """
+    Adds the select_related/prefetch_related calls needed by the view's
+    serializer to get_queryset().
+    """
+
+    def get_queryset(self):
+        return plan_queryset(super().get_queryset(), self.get_serializer_class())
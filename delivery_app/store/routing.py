@@ -1,6 +1,8 @@
 from django.urls import path
-from .consumers import ChatConsumer
+from .consumers import ChatConsumer, OrderTrackingConsumer, CourierLocationConsumer
 
 websocket_urlpatterns = [
     path('ws/chat/<str:room_name>/', ChatConsumer.as_asgi()),
+    path('ws/order/<int:order_id>/', OrderTrackingConsumer.as_asgi()),
+    path('ws/courier/location/', CourierLocationConsumer.as_asgi()),
 ]
\ No newline at end of file
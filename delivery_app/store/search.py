@@ -0,0 +1,128 @@
+import re
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+from rest_framework.filters import BaseFilterBackend
+from .models import SearchDocument, Store, Product, ProductCombo
+
+INDEXED = {
+    Store: ('store', 'store_name'),
+    Product: ('product', 'product_name'),
+    ProductCombo: ('combo', 'combo_name'),
+}
+
+SQLITE_QUERY = """
+    SELECT d.id, d.kind, d.object_id, d.store_id, d.name_en, d.name_ru
+    FROM store_searchdocument_fts f
+    JOIN store_searchdocument d ON d.id = f.rowid
+    WHERE store_searchdocument_fts MATCH %s {kind}
+    ORDER BY bm25(store_searchdocument_fts, 10.0, 10.0, 1.0)
+    LIMIT %s
+"""
+
+POSTGRESQL_QUERY = """
+    SELECT d.id, d.kind, d.object_id, d.store_id, d.name_en, d.name_ru
+    FROM store_searchdocument d
+    WHERE d.search_vector @@ to_tsquery('simple', %s) {kind}
+    ORDER BY ts_rank(d.search_vector, to_tsquery('simple', %s)) DESC
+    LIMIT %s
+"""
+
+
+def build_document(instance):
+    kind, name_field = INDEXED[type(instance)]
+    return {
+        'store_id': instance.pk if kind == 'store' else instance.store_id,
+        'name_en': getattr(instance, f'{name_field}_en') or '',
+        'name_ru': getattr(instance, f'{name_field}_ru') or '',
+        'description': ' '.join(filter(None, [instance.description_en, instance.description_ru])),
+    }
+
+
+def index_object(instance):
+    kind = INDEXED[type(instance)][0]
+    SearchDocument.objects.update_or_create(kind=kind, object_id=instance.pk, defaults=build_document(instance))
+
+
+def unindex_object(instance):
+    SearchDocument.objects.filter(kind=INDEXED[type(instance)][0], object_id=instance.pk).delete()
+
+
+def rebuild_index(batch_size=1000):
+    SearchDocument.objects.all().delete()
+    total = 0
+    for model, (kind, _) in INDEXED.items():
+        documents = []
+        for instance in model.objects.order_by('pk').iterator(chunk_size=batch_size):
+            documents.append(SearchDocument(kind=kind, object_id=instance.pk, **build_document(instance)))
+            if len(documents) >= batch_size:
+                SearchDocument.objects.bulk_create(documents)
+                total += len(documents)
+                documents = []
+        SearchDocument.objects.bulk_create(documents)
+        total += len(documents)
+    return total
+
+
+def get_terms(query):
+    return re.findall(r'\w+', query.lower())[:10]
+
+
+def search(query, kind=None, limit=20):
+    """
+    Ranked prefix search over store, product and combo names (en and ru)
+    and descriptions. Returns dicts with kind, id, store and name in both
+    languages, best match first.
+    """
+    terms = get_terms(query)
+    if not terms:
+        return []
+    kind_sql = 'AND d.kind = %s' if kind else ''
+    kind_params = [kind] if kind else []
+    if connection.vendor == 'postgresql':
+        match = ' & '.join(f'{term}:*' for term in terms)
+        sql, params = POSTGRESQL_QUERY.format(kind=kind_sql), [match, *kind_params, match, limit]
+    elif connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        sql, params = SQLITE_QUERY.format(kind=kind_sql), [match, *kind_params, limit]
+    else:
+        return _search_fallback(terms, kind, limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return [{'kind': row[1], 'id': row[2], 'store': row[3], 'name_en': row[4], 'name_ru': row[5]}
+            for row in rows]
+
+
+def _search_fallback(terms, kind, limit):
+    queryset = SearchDocument.objects.all()
+    if kind:
+        queryset = queryset.filter(kind=kind)
+    for term in terms:
+        queryset = queryset.filter(Q(name_en__icontains=term) | Q(name_ru__icontains=term)
+                                   | Q(description__icontains=term))
+    return [{'kind': d.kind, 'id': d.object_id, 'store': d.store_id, 'name_en': d.name_en, 'name_ru': d.name_ru}
+            for d in queryset[:limit]]
+
+
+# annotation holding a row's position in the full-text results
+SEARCH_RANK = 'search_rank'
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    ?search= over the full-text index, for views listing stores. Matches
+    are annotated with SEARCH_RANK and listed best first (IdCursorPagination
+    pages by it). Only the max_results best matches are listed; a more
+    specific query reaches the rest.
+    """
+    search_param = 'search'
+    max_results = 1000
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not get_terms(query):
+            return queryset
+        ids = [result['id'] for result in search(query, kind='store', limit=self.max_results)]
+        rank = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+        return queryset.filter(pk__in=ids).annotate(**{SEARCH_RANK: rank}).order_by(SEARCH_RANK)
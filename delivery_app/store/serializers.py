@@ -1,7 +1,12 @@
+import math
+import time
 from django.contrib.auth import authenticate
+from django.db.models import Prefetch
 from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import *
+from .fastpath import FastSerializer
+from .thumbnails import ThumbnailField
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -80,15 +85,22 @@ class ContactInfoSerializer(serializers.ModelSerializer):
 
 
 class ProductComboSerializer(serializers.ModelSerializer):
+    thumbnails = ThumbnailField(source='combo_image_hash')
+
     class Meta:
         model = ProductCombo
-        fields = ['combo_name', 'combo_image', 'price', 'description' ]
+        fields = ['combo_name', 'combo_image', 'thumbnails', 'price', 'description' ]
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    thumbnails = ThumbnailField(source='product_image_hash')
+
     class Meta:
         model = Product
-        fields = ['product_name', 'product_image', 'price', 'description']
+        fields = ['product_name', 'product_image', 'thumbnails', 'price', 'description']
+
+
+fast_product = FastSerializer(ProductSerializer)
 
 
 class StoreListSerializer(serializers.ModelSerializer):
@@ -96,10 +108,11 @@ class StoreListSerializer(serializers.ModelSerializer):
     avg_rating = serializers.SerializerMethodField()
     count_people = serializers.SerializerMethodField()
     count_good_grade = serializers.SerializerMethodField()
+    thumbnails = ThumbnailField(source='store_image_hash')
 
     class Meta:
         model = Store
-        fields = ['store_name', 'store_image', 'category', 'avg_rating',
+        fields = ['store_name', 'store_image', 'thumbnails', 'category', 'avg_rating',
                   'count_people', 'count_good_grade']
 
     def get_avg_rating(self, obj):
@@ -112,18 +125,116 @@ class StoreListSerializer(serializers.ModelSerializer):
         return obj.get_count_good_grade()
 
 
+# the Store.get_* methods only read these attributes, so a values_list row works as self
+fast_store_list = FastSerializer(StoreListSerializer, methods={
+    'avg_rating': (Store.get_avg_rating, ('rating_sum', 'review_count')),
+    'count_people': (Store.get_count_people, ('review_count',)),
+    'count_good_grade': (Store.get_count_good_grade, ('good_grade_count', 'review_count')),
+})
+
+
+class StoreNearbySerializer(StoreListSerializer):
+    distance = serializers.SerializerMethodField()
+
+    class Meta(StoreListSerializer.Meta):
+        fields = StoreListSerializer.Meta.fields + ['distance']
+
+    def get_distance(self, obj):
+        return round(obj.distance, 2)
+
+
+class StoreNearbyQuerySerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    radius = serializers.FloatField(default=5, max_value=50)
+    limit = serializers.IntegerField(default=20, min_value=1, max_value=100)
+
+    def validate(self, data):
+        # FloatField lets nan/inf through, and nan passes min/max checks
+        if not all(math.isfinite(data[name]) for name in ('lat', 'lon', 'radius')):
+            raise serializers.ValidationError('Координаты и радиус должны быть конечными числами')
+        if data['radius'] <= 0:
+            raise serializers.ValidationError({'radius': 'Радиус должен быть больше нуля'})
+        return data
+
+
+class LeaderboardQuerySerializer(serializers.Serializer):
+    # out-of-range limits are clamped by get_leaderboard, only non-numbers are rejected
+    limit = serializers.IntegerField(default=20)
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ['product', 'product_name', 'price', 'quantity']
+
+
 class OrderSerializer(serializers.ModelSerializer):
-    order_client = UserProfileSimpleSerializer()
+    order_client = UserProfileSimpleSerializer(source='client', read_only=True)
+    items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
-        fields = ['order_client', 'courier', 'delivery_address']
+        fields = ['id', 'order_client', 'courier', 'delivery_address', 'status', 'items', 'total_price']
+        # couriers are assigned by dispatch and statuses change through the transition action
+        read_only_fields = ['order_client', 'courier', 'status', 'total_price']
+
+
+class OwnerOrderSerializer(OrderSerializer):
+    """A store owner's view of an order: only their own line items and no client details or order total."""
+
+    class Meta(OrderSerializer.Meta):
+        fields = ['id', 'courier', 'delivery_address', 'status', 'items']
+
+
+def prefetch_owner_items(queryset, owner):
+    # OwnerOrderSerializer has no other relations, so this replaces the prefetch planner
+    items = OrderItem.objects.filter(store__owner=owner).order_by('pk')
+    return queryset.prefetch_related(Prefetch('items', queryset=items))
+
+
+class OrderEventSerializer(serializers.ModelSerializer):
+    actor = UserProfileSimpleSerializer(read_only=True)
+    created_date = serializers.DateTimeField(format('%d-%m-%Y %H:%M'), read_only=True)
+
+    class Meta:
+        model = OrderEvent
+        fields = ['from_status', 'to_status', 'actor', 'created_date']
+
+
+class OrderTransitionSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+    expected_status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    delivery_address = serializers.CharField(max_length=64)
 
 
 class CourierSerializer(serializers.ModelSerializer):
     class Meta:
         model = Courier
         fields = '__all__'
+        # positions only change through CourierViewSet.post_location
+        read_only_fields = ['latitude', 'longitude', 'rating_sum', 'review_count', 'avg_rating']
+
+
+class LocationPointSerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    timestamp = serializers.FloatField(required=False, min_value=0)
+
+    def validate(self, data):
+        # FloatField lets nan/inf through, and nan passes min/max checks
+        if not all(math.isfinite(value) for value in data.values()):
+            raise serializers.ValidationError('Координаты и время должны быть конечными числами')
+        if 'timestamp' in data:
+            data['timestamp'] = min(data['timestamp'], time.time())
+        return data
+
+
+class LocationBatchSerializer(serializers.Serializer):
+    points = LocationPointSerializer(many=True, allow_empty=False, max_length=1000)
 
 
 class CourierReviewSerializer(serializers.ModelSerializer):
@@ -136,6 +247,9 @@ class CourierReviewSerializer(serializers.ModelSerializer):
         fields = ['courier', 'client', 'rating', 'created_date',]
 
 
+fast_courier_review = FastSerializer(CourierReviewSerializer)
+
+
 class StoreReviewSerializer(serializers.ModelSerializer):
     client = UserProfileSimpleSerializer(read_only=True)
 
@@ -150,11 +264,12 @@ class StoreDetailSerializer(serializers.ModelSerializer):
     combos = ProductComboSerializer(many=True, read_only=True)
     contact_info = ContactInfoSerializer(many=True, read_only=True)
     store_reviews = StoreReviewSerializer(many=True, read_only=True)
-    owner = UserProfileSimpleSerializer(many=True, read_only=True)
+    owner = UserProfileSimpleSerializer(read_only=True)
+    thumbnails = ThumbnailField(source='store_image_hash')
 
     class Meta:
         model = Store
-        fields = ['store_name', 'store_image', 'category', 'description',
+        fields = ['store_name', 'store_image', 'thumbnails', 'category', 'description',
                   'address', 'owner', 'products', 'combos', 'contact_info', 'store_reviews']
 
 
@@ -183,7 +298,57 @@ class CartItemSerializer(serializers.ModelSerializer):
 
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
+    total_price = serializers.SerializerMethodField()
 
     class Meta:
         model = Cart
-        fields = ['user', 'items']
+        fields = ['user', 'items', 'total_price']
+
+    def get_total_price(self, obj):
+        # annotated by CartViewSet, one aggregate query otherwise
+        total_price = getattr(obj, 'total_price', None)
+        if total_price is None:
+            return obj.get_total_price()
+        return total_price
+
+
+class CartOperationSerializer(serializers.Serializer):
+    OP_CHOICES = ('add', 'update', 'remove')
+    op = serializers.ChoiceField(choices=OP_CHOICES)
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, max_value=1000, default=1)
+
+    def validate(self, data):
+        # 0 means "drop the item" for update/remove; adding nothing is a client bug
+        if data['op'] == 'add' and data['quantity'] < 1:
+            raise serializers.ValidationError({'quantity': 'Количество должно быть не меньше 1'})
+        return data
+
+
+class CartBulkSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=200)
+
+
+class MessageSerializer(serializers.ModelSerializer):
+    author = UserProfileSimpleSerializer(read_only=True)
+    created_date = serializers.DateTimeField(format('%d-%m-%Y %H:%M'), read_only=True)
+
+    class Meta:
+        model = Message
+        fields = ['id', 'author', 'text', 'image', 'video', 'created_date']
+
+
+class ChunkedUploadCreateSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=ChunkedUpload.KIND_CHOICES)
+    filename = serializers.CharField(max_length=128)
+    size = serializers.IntegerField(min_value=1)
+    text = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    message = MessageSerializer(read_only=True)
+
+    class Meta:
+        model = ChunkedUpload
+        fields = ['id', 'kind', 'filename', 'size', 'offset', 'message']
+
@@ -0,0 +1,198 @@
+from functools import partial
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .analytics import retract_order
+from .cache import invalidate_catalogue
+from .geocoding import schedule as schedule_geocode
+from .membership import chat_membership
+from .order_status import CANCELLED
+from .search import index_object, unindex_object
+from .leaderboard import avg_rating_expression, invalidate_leaderboard
+from .tracking import publish_order_status, publish_courier_position
+from .thumbnails import IMAGE_FIELDS, dedupe_upload, hash_field, schedule
+from .models import (Store, StoreReview, Product, ProductCombo, ContactInfo, Category, Chat, Order, OrderEvent,
+                     Courier, CourierReview)
+
+
+def _apply_review(store_id, rating, sign):
+    Store.objects.filter(pk=store_id).update(
+        rating_sum=F('rating_sum') + sign * rating,
+        review_count=F('review_count') + sign,
+        good_grade_count=F('good_grade_count') + sign * int(rating > StoreReview.GOOD_GRADE),
+    )
+
+
+@receiver(pre_save, sender=StoreReview)
+def remember_old_review(sender, instance, **kwargs):
+    instance._old_review = None
+    if instance.pk:
+        instance._old_review = (StoreReview.objects.filter(pk=instance.pk)
+                                .values_list('store_id', 'rating').first())
+
+
+@receiver(post_save, sender=StoreReview)
+def update_store_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_old_review', None)
+    if old is not None:
+        _apply_review(old[0], old[1], -1)
+    _apply_review(instance.store_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=StoreReview)
+def remove_store_rating(sender, instance, **kwargs):
+    _apply_review(instance.store_id, instance.rating, -1)
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+@receiver(post_save, sender=StoreReview)
+@receiver(post_delete, sender=StoreReview)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCombo)
+@receiver(post_delete, sender=ProductCombo)
+@receiver(post_save, sender=ContactInfo)
+@receiver(post_delete, sender=ContactInfo)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def clear_catalogue_cache(sender, **kwargs):
+    invalidate_catalogue()
+
+
+@receiver(m2m_changed, sender=Chat.person.through)
+def clear_chat_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        chat_membership.invalidate(instance.pk, pk_set)
+    elif pk_set:
+        for chat_id in pk_set:
+            chat_membership.invalidate(chat_id, [instance.pk])
+    else:
+        chat_membership.invalidate()
+
+
+@receiver(post_delete, sender=Chat)
+def forget_chat_membership(sender, instance, **kwargs):
+    chat_membership.invalidate(instance.pk)
+
+
+def _address_changed(instance, address_field):
+    if instance.latitude is None or instance.longitude is None:
+        return True
+    if instance.pk is None:
+        return False
+    old = type(instance).objects.filter(pk=instance.pk).values_list(address_field, flat=True).first()
+    return old is not None and old != getattr(instance, address_field)
+
+
+# the lookup is a network call: pre_save only notes that the address
+# changed, and the geocoding runs after the saving transaction commits
+ADDRESS_FIELDS = {Store: 'address', Order: 'delivery_address'}
+
+
+@receiver(pre_save, sender=Store)
+@receiver(pre_save, sender=Order)
+def check_address(sender, instance, raw=False, **kwargs):
+    instance._address_changed = not raw and _address_changed(instance, ADDRESS_FIELDS[sender])
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_save, sender=Order)
+def geocode_address(sender, instance, raw=False, **kwargs):
+    if getattr(instance, '_address_changed', False):
+        instance._address_changed = False
+        field = ADDRESS_FIELDS[sender]
+        transaction.on_commit(partial(schedule_geocode, sender, instance.pk, field, getattr(instance, field)))
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductCombo)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_object(instance)
+
+
+@receiver(pre_save, sender=Store)
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductCombo)
+def check_image(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    field = IMAGE_FIELDS[sender]
+    if instance.pk is not None:
+        old = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+        if old != getattr(instance, field).name:
+            setattr(instance, hash_field(sender), '')
+    dedupe_upload(instance)
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductCombo)
+def generate_thumbnails(sender, instance, raw=False, **kwargs):
+    image = getattr(instance, IMAGE_FIELDS[sender])
+    if not raw and image and not getattr(instance, hash_field(sender)):
+        transaction.on_commit(partial(schedule, sender, instance.pk, image.name))
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductCombo)
+def remove_from_search_index(sender, instance, **kwargs):
+    unindex_object(instance)
+
+
+@receiver(post_save, sender=OrderEvent)
+def retract_cancelled_order(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.to_status == CANCELLED:
+        retract_order(instance.order_id)
+
+
+@receiver(post_save, sender=OrderEvent)
+def push_order_status(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        courier_id = Order.objects.filter(pk=instance.order_id).values_list('courier_id', flat=True).first()
+        publish_order_status(instance.order_id, instance.to_status, courier_id)
+
+
+@receiver(post_save, sender=Courier)
+def push_courier_position(sender, instance, raw=False, **kwargs):
+    if not raw and instance.current_orders_id and instance.latitude is not None and instance.longitude is not None:
+        publish_courier_position(instance.current_orders_id, instance.latitude, instance.longitude)
+
+
+def _apply_courier_review(user_id, rating, sign):
+    with transaction.atomic():
+        couriers = Courier.objects.filter(user_id=user_id)
+        couriers.update(rating_sum=F('rating_sum') + sign * rating, review_count=F('review_count') + sign)
+        couriers.update(avg_rating=avg_rating_expression())
+    invalidate_leaderboard()
+    transaction.on_commit(invalidate_leaderboard)
+
+
+@receiver(pre_save, sender=CourierReview)
+def remember_old_courier_review(sender, instance, **kwargs):
+    instance._old_review = None
+    if instance.pk:
+        instance._old_review = (CourierReview.objects.filter(pk=instance.pk)
+                                .values_list('courier_id', 'rating').first())
+
+
+@receiver(post_save, sender=CourierReview)
+def update_courier_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_old_review', None)
+    if old is not None:
+        _apply_courier_review(old[0], old[1], -1)
+    _apply_courier_review(instance.courier_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=CourierReview)
+def remove_courier_rating(sender, instance, **kwargs):
+    _apply_courier_review(instance.courier_id, instance.rating, -1)
@@ -1,3 +1,1226 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone, translation
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from . import geocoding, thumbnails
+from .cache import get_catalogue_version, local_cache
+from .imaging import render_variants, variant_name
+from .leaderboard import LEADERBOARD_KEY
+from .analytics import aggregate_daily_stats
+from .chat_buffer import MessageBuffer
+from .cart import MAX_QUANTITY, apply_cart_operations
+from .checkout import CheckoutError, checkout
+from .dispatch import dispatch_pending_orders, match_orders
+from .membership import chat_membership
+from .middleware import JWTAuthMiddleware
+from .locations import LocationIngestor
+from .routing import websocket_urlpatterns
+from .uploads import part_path, purge_uploads, start_upload, write_chunk
+from .order_status import CANCELLED, DELIVERED, IN_DELIVERY, PENDING, transition
+from .models import *
+from .fastpath import FastSerializer
+from .serializers import (CourierReviewSerializer, LocationPointSerializer, fast_courier_review, fast_product,
+                          fast_store_list)
 
-# Create your tests here.
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=0)
+class ListQueryCountTest(TestCase):
+    """The list endpoints run a fixed number of queries, however many rows they list."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        self.user = UserProfile.objects.create(username='client', user_role='клиент')
+        self.category = Category.objects.create(category_name='food')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def add_rows(self, count):
+        for i in range(count):
+            store = Store.objects.create(store_name=f'store{i}', category=self.category, description='store',
+                                         address='address', owner=self.owner)
+            product = Product.objects.create(product_name=f'product{i}', description='product', price=100,
+                                             store=store)
+            order = Order.objects.create(client=self.user, cart=self.cart, delivery_address='address',
+                                         courier=self.owner)
+            OrderItem.objects.create(order=order, product=product, store=product.store,
+                                     product_name=product.product_name, price=100, quantity=1)
+
+    def assert_constant_queries(self, url, queries, count=5):
+        # page_size covers both fills, so the second request lists twice the rows
+        for fill in (count, 2 * count):
+            self.add_rows(fill - Store.objects.count())
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, {'page_size': 100}, HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), fill)
+
+    def test_store_list(self):
+        # stores with category
+        self.assert_constant_queries(reverse('store_list'), 1)
+
+    def test_product_list(self):
+        # products with store
+        self.assert_constant_queries(reverse('async_product_list'), 1)
+
+    def test_order_list(self):
+        # orders with client, items
+        self.client.force_authenticate(self.user)
+        self.assert_constant_queries(reverse('order-list-list'), 2)
+
+
+class StoreDetailQueryCountTest(TestCase):
+    # store+category+owner, products, combos, contact_info, store_reviews+client
+    MAX_QUERIES = 5
+
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        category = Category.objects.create(category_name='food')
+        self.store = Store.objects.create(store_name='store', category=category, description='store',
+                                          address='address', owner=self.owner)
+
+    def fill_store(self, count):
+        for i in range(count):
+            client = UserProfile.objects.create(username=f'client{UserProfile.objects.count()}')
+            StoreReview.objects.create(client=client, store=self.store, rating=i % 5 + 1, comment='comment',
+                                       created_date=timezone.now())
+            Product.objects.create(product_name=f'product{i}', description='product', price=100, store=self.store)
+            ProductCombo.objects.create(combo_name=f'combo{i}', description='combo', price=200, store=self.store)
+
+    def get_detail(self):
+        with self.assertNumQueries(self.MAX_QUERIES):
+            response = self.client.get(reverse('store_detail', kwargs={'pk': self.store.pk}))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_query_count_does_not_grow_with_store_data(self):
+        self.fill_store(2)
+        self.assertEqual(len(self.get_detail()['store_reviews']), 2)
+        self.fill_store(30)
+        data = self.get_detail()
+        self.assertEqual(len(data['store_reviews']), 32)
+        self.assertEqual(data['owner']['username'], 'owner')
+
+
+class StoreRatingTest(TestCase):
+    def setUp(self):
+        owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        category = Category.objects.create(category_name='food')
+        self.stores = [Store.objects.create(store_name=f'store{i}', category=category, description='store',
+                                            address='a', owner=owner) for i in range(2)]
+        self.client_user = UserProfile.objects.create(username='client', user_role='клиент')
+
+    def review(self, store, rating):
+        return StoreReview.objects.create(client=self.client_user, store=store, rating=rating, comment='ok',
+                                          created_date=timezone.now())
+
+    def aggregates(self):
+        return [tuple(row) for row in Store.objects.order_by('id')
+                .values_list('rating_sum', 'review_count', 'good_grade_count')]
+
+    def test_reviews_keep_the_aggregates(self):
+        first, second = self.stores
+        review = self.review(first, 5)
+        self.review(first, 2)
+        self.assertEqual(self.aggregates(), [(7, 2, 1), (0, 0, 0)])
+
+        review.rating = 3
+        review.save()
+        self.assertEqual(self.aggregates(), [(5, 2, 0), (0, 0, 0)])
+
+        review.store = second
+        review.rating = 4
+        review.save()
+        self.assertEqual(self.aggregates(), [(2, 1, 0), (4, 1, 1)])
+
+        review.delete()
+        self.assertEqual(self.aggregates(), [(2, 1, 0), (0, 0, 0)])
+        first.refresh_from_db()
+        self.assertEqual((first.get_avg_rating(), first.get_count_people(), first.get_count_good_grade()),
+                         (2.0, 1, '0%'))
+
+    def test_rebuild_store_ratings(self):
+        first, second = self.stores
+        for rating in (5, 4, 1):
+            self.review(first, rating)
+        self.review(second, 3)
+        expected = self.aggregates()
+        Store.objects.update(rating_sum=100, review_count=100, good_grade_count=100)
+        Store.objects.create(store_name='store2', category=first.category, description='store',
+                             address='a', owner=first.owner, rating_sum=9, review_count=9)
+
+        out = io.StringIO()
+        call_command('rebuild_store_ratings', batch_size=1, stdout=out)
+        self.assertEqual(self.aggregates(), expected + [(0, 0, 0)])
+        self.assertEqual(expected, [(10, 3, 2), (3, 1, 0)])
+        self.assertIn('3 stores', out.getvalue())
+
+
+class LocationIngestorTest(TestCase):
+    def setUp(self):
+        user = UserProfile.objects.create(username='courier', user_role='курьер')
+        self.courier = Courier.objects.create(user=user, status='доступен')
+        self.ingestor = LocationIngestor(min_seconds=15, min_meters=50, flush_size=100, flush_interval=60)
+
+    def test_older_ping_does_not_replace_latest(self):
+        now = time.time()
+        self.ingestor.record(self.courier.pk, 42.87, 74.59, now)
+        self.ingestor.record(self.courier.pk, 42.80, 74.50, now - 10)
+        self.assertEqual(self.ingestor.latest(self.courier.pk), (42.87, 74.59, now))
+
+    def test_trail_keeps_only_moves_or_gaps(self):
+        now = time.time() - 100
+        self.ingestor.record(self.courier.pk, 42.87, 74.59, now)
+        self.ingestor.record(self.courier.pk, 42.87001, 74.59001, now + 1)
+        self.ingestor.record(self.courier.pk, 42.88, 74.59, now + 2)
+        self.ingestor.record(self.courier.pk, 42.88, 74.59, now + 20)
+        self.assertEqual(self.ingestor.flush(), 3)
+        self.assertEqual(CourierLocation.objects.filter(courier=self.courier).count(), 3)
+        self.courier.refresh_from_db()
+        self.assertEqual((self.courier.latitude, self.courier.longitude), (42.88, 74.59))
+
+    def test_future_timestamp_is_clamped(self):
+        self.ingestor.record(self.courier.pk, 42.87, 74.59, 1e12)
+        self.assertLessEqual(self.ingestor.latest(self.courier.pk)[2], time.time())
+        self.ingestor.record(self.courier.pk, 42.88, 74.60)
+        self.assertEqual(self.ingestor.latest(self.courier.pk)[:2], (42.88, 74.60))
+
+    def test_bad_values_are_rejected_before_buffering(self):
+        for args in ((42.87, 74.59, 'abc'), (float('nan'), 74.59, None), (42.87, float('inf'), None)):
+            with self.assertRaises(ValueError):
+                self.ingestor.record(self.courier.pk, *args)
+        self.assertEqual(self.ingestor.flush(), 0)
+
+    def test_failed_write_keeps_the_batch(self):
+        self.ingestor.record(self.courier.pk, 42.87, 74.59)
+        with mock.patch.object(CourierLocation.objects, 'bulk_create', side_effect=RuntimeError), \
+                self.assertLogs('store.locations', 'ERROR'):
+            self.assertEqual(self.ingestor.flush(), 0)
+        self.assertEqual(self.ingestor.flush(), 1)
+        self.assertEqual(CourierLocation.objects.count(), 1)
+
+    def test_serializer_rejects_non_finite_and_clamps_timestamp(self):
+        self.assertFalse(LocationPointSerializer(data={'latitude': 'nan', 'longitude': 74}).is_valid())
+        self.assertFalse(LocationPointSerializer(data={'latitude': 91, 'longitude': 74}).is_valid())
+        serializer = LocationPointSerializer(data={'latitude': 42, 'longitude': 74, 'timestamp': 1e15})
+        self.assertTrue(serializer.is_valid())
+        self.assertLessEqual(serializer.validated_data['timestamp'], time.time())
+
+
+class OrderTransitionTest(TestCase):
+    def setUp(self):
+        self.client_user = UserProfile.objects.create(username='client', user_role='клиент')
+        self.other_client = UserProfile.objects.create(username='other', user_role='клиент')
+        self.courier_user = UserProfile.objects.create(username='courier', user_role='курьер')
+        self.other_courier = UserProfile.objects.create(username='courier2', user_role='курьер')
+        self.staff = UserProfile.objects.create(username='staff', user_role='клиент', is_staff=True)
+        self.order = Order.objects.create(client=self.client_user, cart=Cart.objects.create(user=self.client_user),
+                                          delivery_address='address')
+
+    def assign(self):
+        self.order.status, self.order.courier = IN_DELIVERY, self.courier_user
+        self.order.save()
+        return Courier.objects.create(user=self.courier_user, status='занят', current_orders=self.order)
+
+    def post(self, user, new_status, **data):
+        api = APIClient()
+        api.force_authenticate(user)
+        return api.post(reverse('order-list-transition', kwargs={'pk': self.order.pk}),
+                        {'status': new_status, **data}, format='json')
+
+    def test_client_cannot_start_or_finish_delivery(self):
+        self.assertEqual(self.post(self.client_user, IN_DELIVERY).status_code, 403)
+        self.assign()
+        self.assertEqual(self.post(self.client_user, DELIVERED).status_code, 403)
+        self.assertEqual(self.post(self.client_user, CANCELLED).status_code, 403)
+
+    def test_client_cannot_assign_a_courier(self):
+        api = APIClient()
+        api.force_authenticate(self.client_user)
+        response = api.patch(reverse('order-list-detail', kwargs={'pk': self.order.pk}),
+                             {'courier': self.courier_user.pk, 'status': DELIVERED}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.courier_id, self.order.status), (None, PENDING))
+
+    def test_client_cancels_pending_order(self):
+        self.assertEqual(self.post(self.other_client, CANCELLED).status_code, 404)
+        self.assertEqual(self.post(self.client_user, CANCELLED).status_code, 200)
+
+    def test_only_assigned_courier_delivers_and_is_released(self):
+        courier = self.assign()
+        self.assertEqual(self.post(self.other_courier, DELIVERED).status_code, 404)
+        self.assertEqual(self.post(self.courier_user, CANCELLED).status_code, 403)
+        self.assertEqual(self.post(self.courier_user, DELIVERED).status_code, 200)
+        courier.refresh_from_db()
+        self.assertEqual((courier.status, courier.current_orders_id), ('доступен', None))
+
+    def test_staff_cancel_releases_courier(self):
+        courier = self.assign()
+        self.assertEqual(self.post(self.staff, IN_DELIVERY, expected_status=PENDING).status_code, 403)
+        self.assertEqual(self.post(self.staff, CANCELLED).status_code, 200)
+        courier.refresh_from_db()
+        self.assertIsNone(courier.current_orders_id)
+
+    def test_stale_expected_status_conflicts(self):
+        self.assign()
+        self.assertEqual(self.post(self.courier_user, DELIVERED, expected_status=IN_DELIVERY).status_code, 200)
+        response = self.post(self.staff, CANCELLED, expected_status=IN_DELIVERY)
+        self.assertEqual(response.status_code, 409)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, DELIVERED)
+
+
+class DispatchTest(TestCase):
+    def test_nearest_courier_wins(self):
+        couriers = [('far', 42.90, 74.60), ('near', 42.875, 74.571), ('west', 42.875, 74.50)]
+        self.assertEqual(match_orders([('order', 42.8746, 74.5698)], couriers), [('order', 'near')])
+        # orders are served in turn and every courier is used once
+        orders = [(1, 42.8746, 74.5698), (2, 42.8746, 74.5698), (3, 42.8746, 74.5698), (4, 42.8746, 74.5698)]
+        self.assertEqual(match_orders(orders, couriers), [(1, 'near'), (2, 'far'), (3, 'west')])
+
+    def test_matches_a_linear_scan(self):
+        rng = random.Random(1)
+        points = [(i, 42.8 + rng.random() * 0.15, 74.5 + rng.random() * 0.15) for i in range(60)]
+        orders, couriers = points[:30], points[30:]
+        expected, free = [], dict((key, (lat, lon)) for key, lat, lon in couriers)
+        lon_scale = math.cos(math.radians(sum(lat for _, lat, _ in couriers) / len(couriers)))
+        for key, lat, lon in orders:
+            best = min(free, key=lambda c: math.hypot(free[c][0] - lat, (free[c][1] - lon) * lon_scale))
+            del free[best]
+            expected.append((key, best))
+        self.assertEqual(match_orders(orders, couriers, cell_km=0.5), expected)
+
+    def test_no_courier(self):
+        self.assertEqual(match_orders([(1, 42.87, 74.57)], []), [])
+        self.assertEqual(match_orders([(1, 42.87, 74.57)], [('far', 43.87, 74.57)], max_km=10), [])
+
+    def test_dispatch_pending_orders(self):
+        client = UserProfile.objects.create(username='client', user_role='клиент')
+        cart = Cart.objects.create(user=client)
+        order = Order.objects.create(client=client, cart=cart, delivery_address='a', latitude=42.8746,
+                                     longitude=74.5698)
+        self.assertEqual(dispatch_pending_orders(), [])
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.courier_id), (PENDING, None))
+
+        couriers = []
+        for name, latitude in (('far', 42.95), ('near', 42.875)):
+            user = UserProfile.objects.create(username=name, user_role='курьер')
+            couriers.append(Courier.objects.create(user=user, status='доступен', latitude=latitude,
+                                                   longitude=74.5698))
+        far, near = couriers
+        self.assertEqual(dispatch_pending_orders(), [(order.pk, near.pk)])
+        order.refresh_from_db()
+        near.refresh_from_db()
+        far.refresh_from_db()
+        self.assertEqual((order.status, order.courier_id), (IN_DELIVERY, near.user_id))
+        self.assertEqual((near.status, near.current_orders_id), ('занят', order.pk))
+        self.assertEqual((far.status, far.current_orders_id), ('доступен', None))
+        self.assertEqual(list(order.events.values_list('from_status', 'to_status')), [(PENDING, IN_DELIVERY)])
+
+
+class OrderExportTest(TestCase):
+    def test_owner_sees_only_own_items(self):
+        owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        other = UserProfile.objects.create(username='other', user_role='владелец')
+        client = UserProfile.objects.create(username='client', user_role='клиент')
+        category = Category.objects.create(category_name='food')
+        products = [Product.objects.create(product_name=f'p{i}', description='p', price=100, store=Store.objects.create(
+            store_name=f's{i}', category=category, description='s', address='a', owner=user))
+            for i, user in enumerate((owner, other))]
+        order = Order.objects.create(client=client, cart=Cart.objects.create(user=client), delivery_address='a')
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, store=product.store,
+                                     product_name=product.product_name, price=100, quantity=1)
+
+        api = APIClient()
+        api.force_authenticate(owner)
+        response = api.get(reverse('export', kwargs={'kind': 'orders', 'fmt': 'ndjson'}))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([item['product_name'] for item in rows[0]['items']], ['p0'])
+        self.assertNotIn('order_client', rows[0])
+
+
+@override_settings(GEOCODE_WORKERS=0)
+class GeocodingTest(TestCase):
+    def setUp(self):
+        cache = mock.patch.object(geocoding, '_cache', geocoding.GeocodeCache(':memory:'))
+        cache.start()
+        self.addCleanup(cache.stop)
+        self.owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        self.category = Category.objects.create(category_name='food')
+
+    def create_store(self):
+        return Store.objects.create(store_name='store', category=self.category, description='store',
+                                    address='Чуй 1', owner=self.owner)
+
+    def test_geocodes_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            store = self.create_store()
+        self.assertIsNone(Store.objects.get(pk=store.pk).latitude)
+        for callback in callbacks:
+            callback()
+        store.refresh_from_db()
+        self.assertEqual((store.latitude, store.longitude), geocoding.StubGeocoder().geocode('чуй 1'))
+
+    def test_cache_is_per_geocoder(self):
+        class OtherGeocoder:
+            def geocode(self, address):
+                return 1.0, 2.0
+
+        stub = geocoding.geocode('Чуй 1')
+        with mock.patch.object(geocoding, '_geocoder', OtherGeocoder()):
+            self.assertEqual(geocoding.geocode('Чуй 1'), (1.0, 2.0))
+        self.assertEqual(geocoding.geocode('Чуй 1'), stub)
+
+
+class MessageHistoryTest(TestCase):
+    def setUp(self):
+        self.member = UserProfile.objects.create(username='member', user_role='клиент')
+        self.chat = Chat.objects.create()
+        self.chat.person.add(self.member)
+        other_chat = Chat.objects.create()
+        Message.objects.create(chat=other_chat, author=self.member, text='elsewhere')
+        self.messages = [Message.objects.create(chat=self.chat, author=self.member, text=f'm{i}') for i in range(5)]
+        # two messages share a timestamp, the id breaks the tie
+        now = timezone.now()
+        for i, message in enumerate(self.messages):
+            Message.objects.filter(pk=message.pk).update(created_date=now + timedelta(minutes=i // 2))
+        self.api = APIClient()
+
+    def pages(self, **params):
+        url = reverse('chat_messages', kwargs={'chat_id': self.chat.pk})
+        texts = []
+        while url:
+            page = self.api.get(url, params).json()
+            texts += [message['text'] for message in page['results']]
+            url, params = page['next'], {}
+        return texts
+
+    def test_pages_back_from_the_newest(self):
+        self.api.force_authenticate(self.member)
+        self.assertEqual(self.pages(page_size=2), ['m4', 'm3', 'm2', 'm1', 'm0'])
+
+    def test_editing_keeps_the_position(self):
+        self.api.force_authenticate(self.member)
+        message = Message.objects.get(text='m0')
+        message.text = 'edited'
+        message.save()
+        self.assertEqual(self.pages()[-1], 'edited')
+
+    def test_members_only(self):
+        url = reverse('chat_messages', kwargs={'chat_id': self.chat.pk})
+        self.assertEqual(self.api.get(url).status_code, 401)
+        self.api.force_authenticate(UserProfile.objects.create(username='stranger', user_role='клиент'))
+        self.assertEqual(self.api.get(url).status_code, 403)
+
+
+class ChunkedUploadTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root, CHAT_UPLOAD_MAX_CHUNK=16)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = UserProfile.objects.create(username='client', user_role='клиент')
+        self.chat = Chat.objects.create()
+        self.chat.person.add(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, kind='video', size=20):
+        return start_upload(self.user, self.chat.pk, kind, 'clip.mp4', size)
+
+    def patch(self, upload, offset, body):
+        return self.client.generic('PATCH', reverse('chat_upload', kwargs={'pk': upload.pk}), body,
+                                   content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_resume_after_partial_chunk(self):
+        upload = self.start()
+        write_chunk(upload, 0, io.BytesIO(b'\0\0\0\x18ftyp'), 16)
+        self.assertEqual(ChunkedUpload.objects.get(pk=upload.pk).offset, 8)
+
+        self.assertEqual(self.patch(upload, 8, b'isom' + b'x' * 8).status_code, 201)
+        message = ChunkedUpload.objects.get(pk=upload.pk).message
+        with message.video.open('rb') as video:
+            self.assertEqual(video.read(), b'\0\0\0\x18ftypisom' + b'x' * 8)
+
+    def test_wrong_offset_conflicts(self):
+        upload = self.start()
+        self.patch(upload, 0, b'\0\0\0\x18ftyp')
+        response = self.patch(upload, 0, b'\0\0\0\x18ftyp')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 8)
+
+    def test_claimed_offset_conflicts(self):
+        upload = self.start()
+        ChunkedUpload.objects.filter(pk=upload.pk).update(claimed_at=timezone.now())
+        self.assertEqual(self.patch(upload, 0, b'\0\0\0\x18ftyp').status_code, 409)
+        ChunkedUpload.objects.filter(pk=upload.pk).update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.patch(upload, 0, b'\0\0\0\x18ftyp').status_code, 200)
+
+    def test_oversize_chunk(self):
+        upload = self.start()
+        self.assertEqual(self.patch(upload, 0, b'x' * 17).status_code, 413)
+        self.assertEqual(ChunkedUpload.objects.get(pk=upload.pk).offset, 0)
+
+    def test_rejects_non_video(self):
+        upload = self.start(size=8)
+        self.assertEqual(self.patch(upload, 0, b'x' * 8).status_code, 400)
+        self.assertFalse(ChunkedUpload.objects.filter(pk=upload.pk).exists())
+        self.assertFalse(os.path.exists(part_path(upload.pk)))
+
+    def test_purge(self):
+        stale, fresh = self.start(), self.start()
+        ChunkedUpload.objects.filter(pk=stale.pk).update(created_date=timezone.now() - timedelta(days=2))
+        orphan = part_path(fresh.pk).replace(str(fresh.pk), 'orphan')
+        open(orphan, 'wb').close()
+        os.utime(orphan, (0, 0))
+
+        self.assertEqual(purge_uploads(timedelta(days=1)), (1, 1))
+        self.assertEqual(list(ChunkedUpload.objects.values_list('pk', flat=True)), [fresh.pk])
+        self.assertTrue(os.path.exists(part_path(fresh.pk)))
+        self.assertFalse(os.path.exists(orphan))
+
+
+class AsyncStoreListTest(TestCase):
+    def setUp(self):
+        owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        category = Category.objects.create(category_name='food')
+        self.store = Store.objects.create(store_name='store', category=category, description='store',
+                                          address='address', owner=owner)
+
+    def test_rejects_search_and_ordering(self):
+        for query in ({'search': 'store'}, {'ordering': 'store_name'}):
+            self.assertEqual(self.client.get(reverse('async_store_list'), query).status_code, 400)
+
+    @override_settings(CATALOGUE_CACHE_TIMEOUT=0)
+    def test_cache_off(self):
+        # update() sends no signals, so only a bypassed cache sees the new name
+        self.client.get(reverse('async_store_list'))
+        Store.objects.filter(pk=self.store.pk).update(store_name='renamed')
+        [store] = self.client.get(reverse('async_store_list')).json()['results']
+        self.assertEqual(store['store_name'], 'renamed')
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=300, GEOCODE_WORKERS=0)
+class CatalogueCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.addCleanup(local_cache.clear)
+        owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        category = Category.objects.create(category_name='food')
+        self.store = Store.objects.create(store_name='store', category=category, description='store', address='a',
+                                          owner=owner)
+        self.client_user = UserProfile.objects.create(username='client', user_role='клиент')
+
+    def get(self, **headers):
+        return self.client.get(reverse('store_list'), HTTP_ACCEPT='application/json', **headers)
+
+    def test_etag_and_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.get()['ETag'], etag)
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_saving_a_catalogue_model_bumps_the_version(self):
+        version, etag = get_catalogue_version(), self.get()['ETag']
+        self.store.store_name = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store.save()
+        self.assertNotEqual(get_catalogue_version(), version)
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['store_name'], 'renamed')
+
+    def test_update_is_cached_until_invalidated(self):
+        # queryset.update() sends no signals, so the cached page survives it
+        self.get()
+        Store.objects.filter(pk=self.store.pk).update(store_name='renamed')
+        self.assertEqual(self.get().json()['results'][0]['store_name'], 'store')
+
+    def test_rebuild_store_ratings_invalidates(self):
+        StoreReview.objects.create(client=self.client_user, store=self.store, rating=4, comment='ok',
+                                   created_date=timezone.now())
+        Store.objects.filter(pk=self.store.pk).update(rating_sum=0, review_count=0)
+        self.assertEqual(self.get().json()['results'][0]['count_people'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_store_ratings', stdout=io.StringIO())
+        [store] = self.get().json()['results']
+        self.assertEqual((store['avg_rating'], store['count_people']), (4, 1))
+
+
+class FastSerializerTest(TestCase):
+    def setUp(self):
+        owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        category = Category.objects.create(category_name_en='food', category_name_ru='еда')
+        pictured = Store.objects.create(store_name_en='pictured', store_name_ru='с картинкой', category=category,
+                                        description='s', address='a', owner=owner, store_image='store_images/a.png')
+        Store.objects.create(store_name_en='plain', category=category, description='s', address='a', owner=owner)
+        Store.objects.filter(pk=pictured.pk).update(store_image_hash='0' * 64)
+        Product.objects.create(product_name_en='tea', product_name_ru='чай', description='p', price=100,
+                               store=pictured, product_image='product_images/tea.png')
+        Product.objects.create(product_name_en='water', description='p', price=50, store=pictured)
+
+        self.client_user = UserProfile.objects.create(username='client', first_name='Айбек', user_role='клиент')
+        self.courier_user = UserProfile.objects.create(username='courier', user_role='курьер')
+        now = timezone.now()
+        for i in range(5):
+            # two reviews per timestamp, so cursor pages split ties
+            CourierReview.objects.create(client=self.client_user, courier=self.courier_user, rating=i + 1,
+                                         created_date=now - timedelta(hours=i // 2))
+        self.request = APIRequestFactory().get('/')
+
+    def assertWireCompatible(self, fast, queryset):
+        for language in ('en', 'ru'):
+            with translation.override(language):
+                expected = fast.serializer_class(queryset, many=True, context={'request': self.request}).data
+                actual = fast.serialize(fast.rows(queryset), self.request)
+                self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected), language)
+
+    def test_matches_the_model_serializers(self):
+        self.assertWireCompatible(fast_store_list, Store.objects.order_by('id'))
+        self.assertWireCompatible(fast_product, Product.objects.order_by('id'))
+        self.assertWireCompatible(fast_courier_review, CourierReview.objects.order_by('id'))
+
+        # the fixtures cover absolute image urls, thumbnails and missing images
+        with translation.override('ru'):
+            pictured, plain = fast_store_list.serialize(fast_store_list.rows(Store.objects.order_by('id')),
+                                                        self.request)
+        self.assertEqual(pictured['store_image'], 'http://testserver/media/store_images/a.png')
+        self.assertIsNotNone(pictured['thumbnails'])
+        self.assertEqual((plain['store_name'], plain['store_image'], plain['thumbnails']), ('plain', None, None))
+        self.assertEqual(pictured['category'], {'category_name': 'еда'})
+
+    def test_null_foreign_key(self):
+        class OrderStatusSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = Order
+                fields = ['status']
+
+        class CourierOrderSerializer(serializers.ModelSerializer):
+            current_orders = OrderStatusSerializer()
+
+            class Meta:
+                model = Courier
+                fields = ['status', 'current_orders']
+
+        order = Order.objects.create(client=self.client_user, cart=Cart.objects.create(user=self.client_user))
+        Courier.objects.create(user=self.courier_user, status='занят', current_orders=order)
+        Courier.objects.create(user=self.courier_user, status='доступен')
+        self.assertWireCompatible(FastSerializer(CourierOrderSerializer), Courier.objects.order_by('id'))
+
+    def test_cursor_pages(self):
+        api = APIClient()
+        api.force_authenticate(self.client_user)
+        url, results = reverse('courier_reviews-list') + '?page_size=2', []
+        while url:
+            page = api.get(url, HTTP_ACCEPT='application/json').json()
+            results += page['results']
+            url = page['next']
+        expected = CourierReviewSerializer(CourierReview.objects.order_by('-created_date', '-id'), many=True).data
+        self.assertEqual(results, json.loads(JSONRenderer().render(expected)))
+
+
+class StoreNearbyTest(TestCase):
+    LAT, LON = 42.87, 74.57
+
+    def setUp(self):
+        owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        category = Category.objects.create(category_name='food')
+        lon_per_km = 1 / (geocoding.KM_PER_DEGREE * math.cos(math.radians(self.LAT)))
+        # km north, km east: the centre, 1 km away, a corner of the 2 km
+        # bounding box (2.8 km away) and a point outside the box
+        self.stores = {}
+        for name, north, east in (('centre', 0, 0), ('near', 1, 0), ('corner', 1.95, 1.95), ('far', 5, 0)):
+            store = Store.objects.create(store_name=name, category=category, description='s', address=name,
+                                         owner=owner)
+            Store.objects.filter(pk=store.pk).update(latitude=self.LAT + north / geocoding.KM_PER_DEGREE,
+                                                     longitude=self.LON + east * lon_per_km)
+            self.stores[name] = store.pk
+
+    def get(self, **params):
+        return self.client.get(reverse('store_nearby'), {'lat': self.LAT, 'lon': self.LON, **params})
+
+    def test_bounding_box_then_exact_distance(self):
+        with mock.patch('store.views.haversine_many', wraps=geocoding.haversine_many) as haversine:
+            response = self.get(radius=2)
+        candidates = {key for key, _, _ in haversine.call_args.args[2]}
+        self.assertEqual(candidates, {self.stores['centre'], self.stores['near'], self.stores['corner']})
+        stores = response.json()
+        self.assertEqual([store['store_name'] for store in stores], ['centre', 'near'])
+        self.assertAlmostEqual(stores[1]['distance'], 1, places=1)
+
+    def test_invalid_query(self):
+        for params in ({'limit': 0}, {'limit': -5}, {'limit': 101}, {'limit': 'ten'}, {'lat': 'inf'},
+                       {'lat': 'nan'}, {'lat': 91}, {'lon': -181}, {'radius': 0}, {'radius': 51},
+                       {'radius': 'inf'}):
+            self.assertEqual(self.get(**params).status_code, 400, params)
+        self.assertEqual(self.get(limit=100, radius=50).status_code, 200)
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=0)
+class StoreOrderingTest(TestCase):
+    # (en, ru); a missing ru name falls back to en
+    NAMES = [('b', 'д'), ('a', None), ('e', 'в'), ('c', None), ('d', 'а')]
+
+    def setUp(self):
+        owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        category = Category.objects.create(category_name='food')
+        for en, ru in self.NAMES:
+            Store.objects.create(store_name_en=en, store_name_ru=ru, category=category, description='s',
+                                 address='a', owner=owner)
+
+    def pages(self, language, ordering):
+        with translation.override(language):
+            url = reverse('store_list') + f'?ordering={ordering}&page_size=2'
+        names = []
+        while url:
+            page = self.client.get(url, HTTP_ACCEPT='application/json').json()
+            names += [store['store_name'] for store in page['results']]
+            url = page['next']
+        return names
+
+    def test_pages_cover_every_store_in_both_languages(self):
+        for language, resolved in (('en', [en for en, _ in self.NAMES]),
+                                   ('ru', [ru or en for en, ru in self.NAMES])):
+            self.assertEqual(self.pages(language, 'store_name'), sorted(resolved), language)
+            self.assertEqual(self.pages(language, '-store_name'), sorted(resolved, reverse=True), language)
+
+    def test_duplicate_names_are_paged_by_id(self):
+        Store.objects.update(store_name_en='same')
+        self.assertEqual(len(self.pages('en', 'store_name')), len(self.NAMES))
+
+    def test_price_is_not_an_ordering(self):
+        with translation.override('en'):
+            response = self.client.get(reverse('store_list'), {'ordering': 'price'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+
+
+class StoreSearchTest(TestCase):
+    def setUp(self):
+        owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        category = Category.objects.create(category_name='food')
+        # the best match is the oldest store, so rank order differs from -id
+        for name in ('pizza', 'pizza and sushi house', 'sushi bar with pizza by the slice'):
+            Store.objects.create(store_name=name, category=category, description='food', address='a', owner=owner)
+
+    def test_store_list_keeps_rank_order(self):
+        response = self.client.get(reverse('store_list'), {'search': 'pizza'}, HTTP_ACCEPT='application/json')
+        names = [store['store_name'] for store in response.json()['results']]
+        self.assertEqual(names[0], 'pizza')
+        self.assertEqual(len(names), 3)
+
+        pages, url = [], reverse('store_list') + '?search=pizza&page_size=1'
+        while url:
+            page = self.client.get(url, HTTP_ACCEPT='application/json').json()
+            pages += [store['store_name'] for store in page['results']]
+            url = page['next']
+        self.assertEqual(pages, names)
+
+    def test_search_limit_is_at_least_one(self):
+        response = self.client.get(reverse('search'), {'q': 'pizza', 'limit': -1})
+        self.assertEqual(len(response.json()), 1)
+
+
+@override_settings(GEOCODE_WORKERS=0)
+class CheckoutConcurrencyTest(TransactionTestCase):
+    def setUp(self):
+        owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        category = Category.objects.create(category_name='food')
+        store = Store.objects.create(store_name='store', category=category, description='store', address='a',
+                                     owner=owner)
+        self.user = UserProfile.objects.create(username='client', user_role='клиент')
+        cart = Cart.objects.create(user=self.user)
+        for i in range(3):
+            product = Product.objects.create(product_name=f'p{i}', description='p', price=100, store=store)
+            CarItem.objects.create(cart=cart, product=product, quantity=i + 1)
+
+    def test_double_checkout_makes_one_order(self):
+        barrier = threading.Barrier(2)
+        outcomes = []
+
+        def run():
+            barrier.wait()
+            try:
+                outcomes.append(checkout(self.user, 'address'))
+            except CheckoutError as e:
+                outcomes.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), 2)
+        order = Order.objects.get()
+        self.assertEqual(sorted(order.items.values_list('product_name', 'quantity')),
+                         [('p0', 1), ('p1', 2), ('p2', 3)])
+        self.assertEqual(order.total_price, 600)
+        self.assertFalse(CarItem.objects.exists())
+
+    def test_orders_are_only_created_by_checkout(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.post(reverse('order-list-list'), {'delivery_address': 'address'})
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(Order.objects.exists())
+
+    def test_locked_database_is_a_conflict(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        with mock.patch('store.checkout._checkout', side_effect=OperationalError('database is locked')):
+            response = api.post(reverse('checkout'), {'delivery_address': 'address'})
+        self.assertEqual(response.status_code, 409)
+
+
+class CartBulkTest(TestCase):
+    def setUp(self):
+        owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        category = Category.objects.create(category_name='food')
+        store = Store.objects.create(store_name='store', category=category, description='store', address='a',
+                                     owner=owner)
+        self.user = UserProfile.objects.create(username='client', user_role='клиент')
+        self.products = [Product.objects.create(product_name=f'p{i}', description='p', price=100, store=store)
+                         for i in range(3)]
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def quantities(self):
+        return dict(CarItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity'))
+
+    def bulk(self, operations):
+        return self.api.post(reverse('cart-list-bulk'), {'operations': operations}, format='json')
+
+    def test_operations_apply_in_order(self):
+        p0, p1, p2 = (product.pk for product in self.products)
+        response = self.bulk([{'op': 'add', 'product_id': p0, 'quantity': 2},
+                              {'op': 'add', 'product_id': p0},
+                              {'op': 'add', 'product_id': p1, 'quantity': 5},
+                              {'op': 'update', 'product_id': p1, 'quantity': 4},
+                              {'op': 'add', 'product_id': p2},
+                              {'op': 'remove', 'product_id': p2}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {p0: 3, p1: 4})
+        self.assertEqual(response.data['total_price'], 700)
+
+        response = self.bulk([{'op': 'update', 'product_id': p0, 'quantity': 0}])
+        self.assertEqual(self.quantities(), {p1: 4})
+
+    def test_add_needs_a_positive_quantity(self):
+        response = self.bulk([{'op': 'add', 'product_id': self.products[0].pk, 'quantity': 0}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {})
+
+    def test_unknown_product_changes_nothing(self):
+        response = self.bulk([{'op': 'add', 'product_id': self.products[0].pk},
+                              {'op': 'add', 'product_id': 0}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {})
+
+    def test_quantity_stops_at_the_column_maximum(self):
+        product = self.products[0]
+        apply_cart_operations(self.user, [{'op': 'add', 'product_id': product.pk, 'quantity': 1000}] * 40)
+        self.assertEqual(self.quantities(), {product.pk: MAX_QUANTITY})
+
+        # duplicate rows for one product are merged without overflowing either
+        cart = Cart.objects.get(user=self.user)
+        CarItem.objects.create(cart=cart, product=product, quantity=MAX_QUANTITY)
+        apply_cart_operations(self.user, [{'op': 'add', 'product_id': product.pk}])
+        self.assertEqual(self.quantities(), {product.pk: MAX_QUANTITY})
+
+
+@override_settings(STATS_AGGREGATION_LAG_SECONDS=0)
+class DailyStatsTest(TestCase):
+    def setUp(self):
+        owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        self.client_user = UserProfile.objects.create(username='client', user_role='клиент')
+        self.cart = Cart.objects.create(user=self.client_user)
+        self.store = Store.objects.create(store_name='store', category=Category.objects.create(category_name='food'),
+                                          description='store', address='a', owner=owner)
+
+    def order(self, price, status=PENDING):
+        product = Product.objects.create(product_name='p', description='p', price=price, store=self.store)
+        order = Order.objects.create(client=self.client_user, cart=self.cart, delivery_address='a', status=status)
+        OrderItem.objects.create(order=order, product=product, store=self.store, product_name='p', price=price,
+                                 quantity=2)
+        return order, product
+
+    def stats(self):
+        return StoreDailyStats.objects.values_list('order_count', 'revenue', 'review_count').get(store=self.store)
+
+    def test_orders(self):
+        _, deleted = self.order(100)
+        deleted.delete()
+        self.order(50, status=CANCELLED)
+        later, _ = self.order(30)
+
+        aggregate_daily_stats()
+        self.assertEqual(self.stats(), (2, 260, 0))
+
+        transition(later.pk, PENDING, CANCELLED)
+        self.assertEqual(self.stats(), (1, 200, 0))
+        aggregate_daily_stats()
+        self.assertEqual(self.stats(), (1, 200, 0))
+
+    @override_settings(STATS_AGGREGATION_LAG_SECONDS=3600)
+    def test_reviews_wait_for_the_lag(self):
+        earlier = timezone.now() - timedelta(hours=2)
+        self.order(100)
+        Order.objects.update(created_date=earlier)
+        review = StoreReview.objects.create(client=self.client_user, store=self.store, rating=5, comment='ok',
+                                            created_date=earlier)
+        aggregate_daily_stats()
+        self.assertEqual(self.stats(), (1, 200, 0))
+
+        StoreReview.objects.filter(pk=review.pk).update(added_date=earlier)
+        aggregate_daily_stats()
+        self.assertEqual(self.stats()[2], 1)
+
+    def test_future_dated_review_does_not_stall(self):
+        for days in (365, 0):
+            StoreReview.objects.create(client=self.client_user, store=self.store, rating=5, comment='ok',
+                                       created_date=timezone.now() + timedelta(days=days))
+        aggregate_daily_stats()
+        self.assertEqual(sum(StoreDailyStats.objects.values_list('review_count', flat=True)), 2)
+
+    def test_analytics_needs_a_login(self):
+        response = APIClient().get(reverse('store_analytics', kwargs={'pk': self.store.pk}))
+        self.assertEqual(response.status_code, 401)
+
+
+class MessageBufferTest(TransactionTestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create(username='client', user_role='клиент')
+        self.chat = Chat.objects.create()
+
+    def message(self, text, chat_id=None):
+        return Message(chat_id=chat_id or self.chat.pk, author=self.user, text=text)
+
+    def saved(self):
+        return list(Message.objects.order_by('pk').values_list('text', flat=True))
+
+    async def test_flushes_when_full(self):
+        buffer = MessageBuffer(max_size=2, interval=60)
+        for i in range(5):
+            await buffer.add(self.message(str(i)))
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(await sync_to_async(self.saved)(), ['0', '1', '2', '3'])
+        await buffer.flush()
+        self.assertEqual(await sync_to_async(self.saved)(), ['0', '1', '2', '3', '4'])
+
+    async def test_flushes_after_interval(self):
+        buffer = MessageBuffer(max_size=100, interval=0.01)
+        await buffer.add(self.message('late'))
+        self.assertEqual(await sync_to_async(self.saved)(), [])
+        await asyncio.sleep(0.1)
+        self.assertEqual(await sync_to_async(self.saved)(), ['late'])
+
+    async def test_failed_batch_is_kept(self):
+        buffer = MessageBuffer(max_size=2, interval=60)
+        with (mock.patch('store.chat_buffer._save_messages', side_effect=OperationalError('database is locked')),
+              self.assertLogs('store.chat_buffer', 'ERROR')):
+            await buffer.add(self.message('a'))
+            await buffer.add(self.message('b'))
+        self.assertEqual(len(buffer), 2)
+        buffer._timer.cancel()
+        await buffer.flush()
+        self.assertEqual(await sync_to_async(self.saved)(), ['a', 'b'])
+
+    async def test_drops_only_bad_rows(self):
+        buffer = MessageBuffer(max_size=3, interval=60)
+        with self.assertLogs('store.chat_buffer', 'WARNING'):
+            for message in (self.message('a'), self.message('orphan', chat_id=10 ** 6), self.message('b')):
+                await buffer.add(message)
+        self.assertEqual(await sync_to_async(self.saved)(), ['a', 'b'])
+
+
+class ChatSocketAuthTest(TransactionTestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create(username='client', user_role='клиент')
+        self.chat = Chat.objects.create()
+        chat_membership.invalidate()
+
+    async def authenticate(self, token):
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        await JWTAuthMiddleware(app)({'type': 'websocket', 'query_string': f'token={token}'.encode()}, None, None)
+        return scopes[0].get('user')
+
+    async def test_middleware_rejects_bad_tokens(self):
+        token = AccessToken.for_user(self.user)
+        self.assertEqual((await self.authenticate(token)).id, self.user.pk)
+
+        self.assertIsNone(await self.authenticate('garbage'))
+        self.assertIsNone(await self.authenticate(str(token)[:-2]))
+        token.set_exp(lifetime=-timedelta(seconds=1))
+        self.assertIsNone(await self.authenticate(token))
+
+    async def test_membership_follows_m2m_changes(self):
+        self.assertFalse(await chat_membership.is_member(self.chat.pk, self.user.pk))
+        await sync_to_async(self.chat.person.add)(self.user)
+        self.assertTrue(await chat_membership.is_member(self.chat.pk, self.user.pk))
+        await sync_to_async(self.user.chat_set.remove)(self.chat)
+        self.assertFalse(await chat_membership.is_member(self.chat.pk, self.user.pk))
+
+
+class ChatBenchTest(TestCase):
+    def test_every_member_gets_every_room_message(self):
+        # runs on the in-memory channel layer, no Redis needed
+        out = io.StringIO()
+        call_command('bench_chat', backend=['memory'], connections=6, rooms=2, messages=3, stdout=out)
+        self.assertTrue(out.getvalue().startswith('memory: 18 messages'), out.getvalue())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   ORDER_POSITION_INTERVAL_MS=100)
+class OrderTrackingSocketTest(TransactionTestCase):
+    def setUp(self):
+        patcher = mock.patch('store.signals.schedule_geocode')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client_user = UserProfile.objects.create(username='client', user_role='клиент')
+        courier_user = UserProfile.objects.create(username='courier', user_role='курьер')
+        self.order = Order.objects.create(client=self.client_user, cart=Cart.objects.create(user=self.client_user),
+                                          delivery_address='address')
+        self.courier = Courier.objects.create(user=courier_user, status='доступен')
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/order/{self.order.pk}/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_status_changes_are_pushed(self):
+        communicator, connected = await self.connect(self.client_user)
+        self.assertTrue(connected)
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'status', 'status': PENDING, 'courier': None})
+
+        await sync_to_async(transition)(self.order.pk, PENDING, IN_DELIVERY, courier_id=self.courier.user_id)
+        self.assertEqual(await communicator.receive_json_from(),
+                         {'type': 'status', 'status': IN_DELIVERY, 'courier': self.courier.user_id})
+        await communicator.disconnect()
+
+    async def test_positions_are_coalesced(self):
+        communicator, _ = await self.connect(self.client_user)
+        await communicator.receive_json_from()
+
+        self.courier.current_orders = self.order
+        for latitude in (42.1, 42.2, 42.3):
+            self.courier.latitude, self.courier.longitude = latitude, 74.5
+            await sync_to_async(self.courier.save)()
+        received = [await communicator.receive_json_from()]
+        while not await communicator.receive_nothing(0.2):
+            received.append(await communicator.receive_json_from())
+        # pings that arrive within one interval collapse into the latest
+        self.assertEqual({message['type'] for message in received}, {'position'})
+        self.assertLess(len(received), 3)
+        self.assertEqual(received[-1]['latitude'], 42.3)
+        await communicator.disconnect()
+
+    async def test_strangers_are_refused(self):
+        stranger = await sync_to_async(UserProfile.objects.create)(username='stranger', user_role='клиент')
+        _, connected = await self.connect(stranger)
+        self.assertFalse(connected)
+
+
+@override_settings(THUMBNAIL_WORKERS=0, GEOCODE_WORKERS=0)
+class ThumbnailTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.owner = UserProfile.objects.create(username='owner', user_role='владелец')
+        self.category = Category.objects.create(category_name='food')
+        png = io.BytesIO()
+        Image.new('RGB', (600, 400), 'red').save(png, 'PNG')
+        self.png = png.getvalue()
+
+    def create_store(self, filename, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Store.objects.create(store_name=filename, category=self.category, description='store',
+                                        address='a', owner=self.owner,
+                                        store_image=SimpleUploadedFile(filename, content))
+
+    def test_variants_are_keyed_by_content(self):
+        first = self.create_store('a.png', self.png)
+        second = self.create_store('b.png', self.png)
+        first.refresh_from_db()
+        digest = hashlib.sha256(self.png).hexdigest()
+        self.assertEqual((first.store_image_hash, second.store_image_hash), (digest, digest))
+        self.assertEqual(second.store_image.name, first.store_image.name)
+
+        small = os.path.join(self.media_root, variant_name(digest, 'small', 'webp'))
+        modified = os.stat(small).st_mtime_ns
+        self.assertEqual(render_variants(first.store_image.path, self.media_root, thumbnails.get_sizes()), digest)
+        self.assertEqual(os.stat(small).st_mtime_ns, modified)
+
+    def test_broken_image_keeps_the_original(self):
+        with self.assertLogs('store.thumbnails', 'ERROR'):
+            store = self.create_store('broken.png', b'not an image')
+        store.refresh_from_db()
+        self.assertEqual(store.store_image_hash, '')
+        data = self.client.get(reverse('store_detail', kwargs={'pk': store.pk}), HTTP_ACCEPT='application/json').json()
+        self.assertIsNone(data['thumbnails'])
+        self.assertTrue(data['store_image'].endswith('.png'))
+
+    def test_broken_pool_is_retried_once(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            thumbnails._on_rendered(Store, 1, 'store_images/a.png', future, True)
+            schedule.assert_called_once_with(Store, 1, 'store_images/a.png', retry=False)
+            with self.assertLogs('store.thumbnails', 'ERROR'):
+                thumbnails._on_rendered(Store, 1, 'store_images/a.png', future, False)
+            schedule.assert_called_once()
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        cache.delete(LEADERBOARD_KEY)
+        for i in range(3):
+            user = UserProfile.objects.create(username=f'courier{i}', user_role='курьер')
+            Courier.objects.create(user=user, status='доступен', rating_sum=4 + i, review_count=1, avg_rating=4 + i)
+
+    def get(self, **params):
+        return self.client.get(reverse('courier-list-leaderboard'), params, HTTP_ACCEPT='application/json')
+
+    def test_limit_is_clamped(self):
+        self.assertEqual([row['username'] for row in self.get().json()], ['courier2', 'courier1', 'courier0'])
+        self.assertEqual(len(self.get(limit=0).json()), 1)
+        self.assertEqual(len(self.get(limit=-5).json()), 1)
+        self.assertEqual(len(self.get(limit=10 ** 6).json()), 3)
+
+    def test_non_integer_limit(self):
+        for limit in ('ten', '1.5', '2x'):
+            self.assertEqual(self.get(limit=limit).status_code, 400, limit)
+
+    def test_cached_with_a_timeout(self):
+        with override_settings(LEADERBOARD_CACHE_TIMEOUT=60), mock.patch('store.leaderboard.cache') as fake:
+            fake.get.return_value = None
+            self.get()
+        self.assertEqual(fake.set.call_args.args[2], 60)
+
+
+class CourierAccessTest(TestCase):
+    def setUp(self):
+        self.client_user = UserProfile.objects.create(username='client', user_role='клиент')
+        self.other_client = UserProfile.objects.create(username='other', user_role='клиент')
+        self.courier_user = UserProfile.objects.create(username='courier', user_role='курьер')
+        self.staff = UserProfile.objects.create(username='staff', user_role='клиент', is_staff=True)
+        order = Order.objects.create(client=self.client_user, cart=Cart.objects.create(user=self.client_user),
+                                     delivery_address='address', courier=self.courier_user, status=IN_DELIVERY)
+        self.courier = Courier.objects.create(user=self.courier_user, status='занят', current_orders=order,
+                                              latitude=42.87, longitude=74.59)
+        ingestor = LocationIngestor(min_seconds=0, min_meters=0, flush_size=100, flush_interval=60)
+        ingestor.record(self.courier.pk, 42.88, 74.6)
+        patcher = mock.patch('store.views.ingestor', ingestor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_location(self, user):
+        api = APIClient()
+        if user is not None:
+            api.force_authenticate(user)
+        return api.get(reverse('courier-list-get-location', kwargs={'pk': self.courier.pk}))
+
+    def test_who_reads_a_location(self):
+        self.assertEqual(self.get_location(None).status_code, 401)
+        self.assertEqual(self.get_location(self.other_client).status_code, 404)
+        for user in (self.client_user, self.courier_user, self.staff):
+            self.assertEqual(self.get_location(user).status_code, 200, user.username)
+
+    def test_list_is_scoped(self):
+        api = APIClient()
+        self.assertEqual(api.get(reverse('courier-list-list')).status_code, 401)
+        api.force_authenticate(self.other_client)
+        self.assertEqual(api.get(reverse('courier-list-list')).json()['results'], [])
+
+    def test_position_is_read_only(self):
+        api = APIClient()
+        url = reverse('courier-list-detail', kwargs={'pk': self.courier.pk})
+        self.assertEqual(api.patch(url, {'latitude': 0}, format='json').status_code, 401)
+        api.force_authenticate(self.client_user)
+        self.assertEqual(api.patch(url, {'latitude': 0}, format='json').status_code, 403)
+        api.force_authenticate(self.courier_user)
+        self.assertEqual(api.patch(url, {'latitude': 0, 'longitude': 0}, format='json').status_code, 200)
+        self.courier.refresh_from_db()
+        self.assertEqual((self.courier.latitude, self.courier.longitude), (42.87, 74.59))
+
+
+class OrderVisibilityTest(TestCase):
+    def setUp(self):
+        self.client_user = UserProfile.objects.create(username='client', user_role='клиент')
+        self.other_client = UserProfile.objects.create(username='other', user_role='клиент')
+        self.courier = UserProfile.objects.create(username='courier', user_role='курьер')
+        self.owners = [UserProfile.objects.create(username=f'owner{i}', user_role='владелец') for i in range(2)]
+        category = Category.objects.create(category_name='food')
+        order = Order.objects.create(client=self.client_user, cart=Cart.objects.create(user=self.client_user),
+                                     delivery_address='a', courier=self.courier, total_price=300)
+        for i, owner in enumerate(self.owners):
+            store = Store.objects.create(store_name=f's{i}', category=category, description='s', address='a',
+                                         owner=owner)
+            product = Product.objects.create(product_name=f'p{i}', description='p', price=100, store=store)
+            OrderItem.objects.create(order=order, product=product, store=store, product_name=f'p{i}', price=100,
+                                     quantity=i + 1)
+
+    def list_orders(self, user):
+        api = APIClient()
+        api.force_authenticate(user)
+        return api.get(reverse('order-list-list')).json()['results']
+
+    def test_client_and_courier_see_the_whole_order(self):
+        for user in (self.client_user, self.courier):
+            [order] = self.list_orders(user)
+            self.assertEqual([item['product_name'] for item in order['items']], ['p0', 'p1'])
+            self.assertEqual(order['total_price'], 300)
+            self.assertEqual(order['order_client']['username'], 'client')
+        self.assertEqual(self.list_orders(self.other_client), [])
+
+    def test_owner_sees_only_own_items(self):
+        for i, owner in enumerate(self.owners):
+            [order] = self.list_orders(owner)
+            self.assertEqual([item['product_name'] for item in order['items']], [f'p{i}'])
+            self.assertNotIn('order_client', order)
+            self.assertNotIn('total_price', order)
@@ -0,0 +1,134 @@
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection
+from rest_framework import serializers
+from .cache import invalidate_catalogue
+from .imaging import ENCODERS, file_digest, render_variants, variant_name
+from .models import Product, ProductCombo, Store
+
+logger = logging.getLogger(__name__)
+
+# model -> image field; the content digest lives in '<field>_hash' and is
+# only set once every variant of that image exists on disk. Until then (or
+# if rendering fails) ThumbnailField is None and clients use the original.
+IMAGE_FIELDS = {Store: 'store_image', Product: 'product_image', ProductCombo: 'combo_image'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_sizes():
+    return getattr(settings, 'THUMBNAIL_SIZES', {'small': (160, 160), 'medium': (480, 480)})
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2))
+        return _executor
+
+
+def reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+
+
+def hash_field(model):
+    return f'{IMAGE_FIELDS[model]}_hash'
+
+
+def dedupe_upload(instance):
+    """
+    If the new upload on instance has the same bytes as an image that is
+    already stored (and thumbnailed), point it at that file instead of
+    saving another copy.
+    """
+    field_file = getattr(instance, IMAGE_FIELDS[type(instance)])
+    if not field_file or field_file._committed:
+        return
+    digest = file_digest(field_file.file)
+    field_file.file.seek(0)
+    for model, field in IMAGE_FIELDS.items():
+        name = model.objects.filter(**{hash_field(model): digest}).values_list(field, flat=True).first()
+        if name:
+            field_file.name = name
+            field_file._committed = True
+            setattr(instance, hash_field(type(instance)), digest)
+            return
+
+
+def schedule(model, pk, name, retry=True):
+    """Render the thumbnails of model pk's image name off the request path."""
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        return
+    if not getattr(settings, 'THUMBNAIL_WORKERS', 2):
+        try:
+            store_digest(model, pk, name, render_variants(path, settings.MEDIA_ROOT, get_sizes()))
+        except Exception:
+            logger.exception('Failed to render thumbnails for %s %s', model.__name__, pk)
+        return
+    future = get_executor().submit(render_variants, path, settings.MEDIA_ROOT, get_sizes())
+    future.add_done_callback(lambda future: _on_rendered(model, pk, name, future, retry))
+
+
+def _on_rendered(model, pk, name, future, retry):
+    # runs on the executor's management thread, which has its own connection
+    try:
+        store_digest(model, pk, name, future.result())
+    except BrokenProcessPool:
+        # a worker died (e.g. killed for memory), which breaks the whole
+        # pool: start a new one and give the image one more try
+        reset_executor()
+        if retry:
+            schedule(model, pk, name, retry=False)
+        else:
+            logger.error('Thumbnail workers died rendering %s %s', model.__name__, pk)
+    except Exception:
+        logger.exception('Failed to render thumbnails for %s %s', model.__name__, pk)
+    finally:
+        connection.close()
+
+
+def store_digest(model, pk, name, digest):
+    # the image may have been replaced while the worker was busy
+    updated = (model.objects.filter(pk=pk, **{IMAGE_FIELDS[model]: name})
+               .exclude(**{hash_field(model): digest})
+               .update(**{hash_field(model): digest}))
+    if updated:
+        invalidate_catalogue()
+
+
+def thumbnail_urls(digest, request=None):
+    if not digest:
+        return None
+    urls = {}
+    for size in get_sizes():
+        urls[size] = {}
+        for fmt in ENCODERS:
+            url = default_storage.url(variant_name(digest, size, fmt))
+            urls[size][fmt] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+class ThumbnailField(serializers.Field):
+    """{size: {'webp': url, 'jpeg': url}} for an image, or None until its thumbnails exist."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return self.represent(value, self.context.get('request'))
+
+    def represent(self, value, request):
+        return thumbnail_urls(value, request)
@@ -0,0 +1,31 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def order_group(order_id):
+    return f'order_{order_id}'
+
+
+def _group_send(order_id, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(order_group(order_id), event)
+    except Exception:
+        # tracking is best effort, the order itself is already saved
+        logger.exception('Failed to publish %s for order %s', event['type'], order_id)
+
+
+def publish_order_status(order_id, status, courier_id=None):
+    event = {'type': 'order.status', 'order': order_id, 'status': status, 'courier': courier_id}
+    transaction.on_commit(lambda: _group_send(order_id, event))
+
+
+def publish_courier_position(order_id, latitude, longitude):
+    event = {'type': 'courier.position', 'order': order_id, 'latitude': latitude, 'longitude': longitude}
+    transaction.on_commit(lambda: _group_send(order_id, event))
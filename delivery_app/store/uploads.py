@@ -0,0 +1,188 @@
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image
+from .models import ChunkedUpload, Message
+
+BLOCK_SIZE = 64 * 1024
+UPLOAD_DIR = 'uploads'
+# where finished files go, the same directories as Message.image/video
+TARGET_DIRS = {'image': 'images', 'video': 'videos'}
+# a writer renews its claim every CLAIM_REFRESH; a claim older than
+# CLAIM_TIMEOUT belongs to a request that died and can be taken over
+CLAIM_REFRESH = timedelta(seconds=30)
+CLAIM_TIMEOUT = timedelta(minutes=5)
+# (position, bytes) signatures of the containers chat videos come in
+VIDEO_SIGNATURES = (
+    (4, b'ftyp'),  # mp4, mov, m4v, 3gp
+    (4, b'moov'), (4, b'mdat'), (4, b'wide'), (4, b'free'),  # older QuickTime
+    (0, b'\x1a\x45\xdf\xa3'),  # webm, mkv
+    (8, b'AVI '),  # avi (RIFF)
+)
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadConflict(UploadError):
+    def __init__(self, offset):
+        super().__init__(f'Ожидается смещение {offset}')
+        self.offset = offset
+
+
+def part_path(upload_id):
+    return default_storage.path(f'{UPLOAD_DIR}/{upload_id}.part')
+
+
+def start_upload(user, chat_id, kind, filename, size, text=''):
+    if size > getattr(settings, 'CHAT_UPLOAD_MAX_SIZE', 512 * 1024 * 1024):
+        raise UploadError('Файл слишком большой')
+    upload = ChunkedUpload.objects.create(chat_id=chat_id, author=user, kind=kind, filename=filename,
+                                          size=size, text=text)
+    path = part_path(upload.pk)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Copy length bytes of stream into the upload's part file at offset, in
+    BLOCK_SIZE pieces so memory stays flat whatever the chunk size. A chunk
+    that breaks off early still counts for the bytes that arrived; the
+    client resumes from the returned upload.offset.
+    """
+    if upload.message_id is not None:
+        raise UploadError('Загрузка уже завершена')
+    if offset != upload.offset:
+        raise UploadConflict(upload.offset)
+    length = min(length, upload.size - offset)
+
+    # claim the offset before touching the file, so a second request for
+    # the same offset gets a 409 instead of writing over this one
+    claimed_at = _claim(upload, offset)
+    written = 0
+    try:
+        with open(part_path(upload.pk), 'r+b') as part:
+            part.seek(offset)
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                if timezone.now() - claimed_at >= CLAIM_REFRESH:
+                    claimed_at = _claim(upload, offset, claimed_at)
+                part.write(block)
+                written += len(block)
+    finally:
+        # the file is closed, so whatever was written is on disk; a claim
+        # that was lost to another request does not move the offset
+        released = (ChunkedUpload.objects.filter(pk=upload.pk, offset=offset, claimed_at=claimed_at)
+                    .update(offset=offset + written, claimed_at=None))
+    if not released:
+        upload.refresh_from_db(fields=['offset'])
+        raise UploadConflict(upload.offset)
+    upload.offset = offset + written
+    if upload.offset == upload.size:
+        complete_upload(upload)
+    return upload
+
+
+def _claim(upload, offset, claimed_at=None):
+    """
+    Take the claim on upload at offset, or renew the claim taken at
+    claimed_at. Raises UploadConflict if another request holds it.
+    """
+    now = timezone.now()
+    claims = ChunkedUpload.objects.filter(pk=upload.pk, offset=offset)
+    if claimed_at is None:
+        claims = claims.filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - CLAIM_TIMEOUT))
+    else:
+        claims = claims.filter(claimed_at=claimed_at)
+    if not claims.update(claimed_at=now):
+        upload.refresh_from_db(fields=['offset'])
+        raise UploadConflict(upload.offset)
+    return now
+
+
+def is_video(path):
+    with open(path, 'rb') as file:
+        head = file.read(12)
+    return any(head[position:position + len(signature)] == signature for position, signature in VIDEO_SIGNATURES)
+
+
+def complete_upload(upload):
+    """
+    Move the finished part file into place and attach it to a new Message.
+    The move is a rename on the same filesystem, so the bytes are never
+    copied again.
+    """
+    source = part_path(upload.pk)
+    if upload.kind == 'image':
+        try:
+            with Image.open(source) as image:
+                image.verify()
+        except Exception:
+            discard_upload(upload)
+            raise UploadError('Файл не является изображением')
+    elif not is_video(source):
+        discard_upload(upload)
+        raise UploadError('Файл не является видео')
+
+    name = default_storage.generate_filename(f'{TARGET_DIRS[upload.kind]}/{os.path.basename(upload.filename)}')
+    name = default_storage.get_available_name(name)
+    target = default_storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(source, target)
+
+    with transaction.atomic():
+        upload.message = Message.objects.create(chat_id=upload.chat_id, author_id=upload.author_id,
+                                                text=upload.text, **{upload.kind: name})
+        upload.save(update_fields=['message'])
+    return upload.message
+
+
+def discard_upload(upload):
+    try:
+        os.remove(part_path(upload.pk))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def purge_uploads(max_age):
+    """
+    Remove uploads that were started more than max_age ago and never
+    finished, and part files left without an upload (e.g. after their chat
+    was deleted). Returns how many uploads and files were removed.
+    """
+    now = timezone.now()
+    cutoff = now - max_age
+    stale = (ChunkedUpload.objects.filter(message__isnull=True, created_date__lt=cutoff)
+             .exclude(claimed_at__gte=now - CLAIM_TIMEOUT))
+    uploads = 0
+    for upload in stale.iterator():
+        discard_upload(upload)
+        uploads += 1
+
+    directory = default_storage.path(UPLOAD_DIR)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return uploads, 0
+    pending = {str(pk) for pk in ChunkedUpload.objects.filter(message__isnull=True).values_list('pk', flat=True)}
+    files = 0
+    for name in names:
+        path = os.path.join(directory, name)
+        if (name.endswith('.part') and name[:-len('.part')] not in pending
+                and os.path.getmtime(path) < cutoff.timestamp()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            files += 1
+    return uploads, files
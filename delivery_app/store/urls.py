@@ -1,5 +1,6 @@
 from django.urls import path, include
 from .views import *
+from . import async_views
 from rest_framework import routers, urls
 
 
@@ -19,8 +20,20 @@ urlpatterns = [
     path('login/', CustomLoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('store/', StoreListApiView.as_view(), name='store_list'),
+    path('checkout/', CheckoutApiView.as_view(), name='checkout'),
+    path('search/', SearchApiView.as_view(), name='search'),
+    path('store/nearby/', StoreNearbyApiView.as_view(), name='store_nearby'),
     path('store/<int:pk>/', StoreDetailApiView.as_view(), name='store_detail'),
+    path('store/<int:pk>/analytics/', StoreAnalyticsApiView.as_view(), name='store_analytics'),
     path('store/create/', StoreCreateApiView.as_view(), name='store_create'),
     path('store/edit/<int:pk>/', StoreUpdateDeleteApiView.as_view(), name='store_edit'),
+    path('export/<str:kind>.<str:fmt>', ExportApiView.as_view(), name='export'),
+    path('chat/<int:chat_id>/messages/', MessageHistoryApiView.as_view(), name='chat_messages'),
+    path('chat/<int:chat_id>/uploads/', ChatUploadCreateApiView.as_view(), name='chat_upload_create'),
+    path('uploads/<uuid:pk>/', ChatUploadApiView.as_view(), name='chat_upload'),
+    path('async/store/', async_views.store_list, name='async_store_list'),
+    path('async/store/<int:pk>/', async_views.store_detail, name='async_store_detail'),
+    path('async/product/', async_views.product_list, name='async_product_list'),
+    path('async/order/<int:pk>/status/', async_views.order_status, name='async_order_status'),
 
 ]
\ No newline at end of file
@@ -1,11 +1,31 @@
+import io
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets, generics, status, permissions
+from rest_framework import mixins, viewsets, generics, status, permissions
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import *
-from rest_framework.filters import SearchFilter, OrderingFilter
+from django.utils import translation
+from .prefetch import PrefetchPlanMixin, plan_queryset
+from .pagination import CreatedDateCursorPagination, CursorOrderingFilter, MessageCursorPagination
+from .cache import CatalogueCacheMixin
+from .fastpath import FastListMixin
+from .geocoding import bounding_box, haversine_many
+from .search import FullTextSearchFilter, search
+from .checkout import CheckoutConflict, CheckoutError, checkout
+from .cart import CartError, apply_cart_operations
+from .analytics import get_daily_stats
+from .leaderboard import get_leaderboard
+from .locations import ingestor
+from .exports import EXPORTS, FORMATS, export_queryset, stream_export
+from .uploads import UploadConflict, UploadError, discard_upload, start_upload, write_chunk
+from .order_status import (TransitionConflict, TransitionError, TransitionForbidden, check_actor,
+                           transition as transition_order)
 from .permissions import (CheckCreateStore, CheckOwnerStore, CheckCourier, CheckOrder, CheckReview, CheckOrderUser,
-                          CheckCRUD)
+                          CheckCRUD, CheckChatMember, CheckCourierAccess, CheckCourierRole)
 
 
 class RegisterView(generics.CreateAPIView):
@@ -43,89 +63,347 @@ class LogoutView(generics.GenericAPIView):
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
 
-class StoreListApiView(generics.ListAPIView):
+class StoreListApiView(CatalogueCacheMixin, FastListMixin, PrefetchPlanMixin, generics.ListAPIView):
     queryset = Store.objects.all()
     serializer_class = StoreListSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    fast_serializer = fast_store_list
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, CursorOrderingFilter]
     filterset_fields = ['category']
-    search_fields = ['store_name']
-    ordering_fields = ['price', 'store_name']
+    ordering_fields = ['store_name']
     permission_classes = [CheckCRUD]
 
 
-class StoreDetailApiView(generics.RetrieveAPIView):
+class StoreNearbyApiView(PrefetchPlanMixin, generics.ListAPIView):
+    queryset = Store.objects.all()
+    serializer_class = StoreNearbySerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['category']
+    permission_classes = [CheckCRUD]
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        query = StoreNearbyQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        data = query.validated_data
+        latitude, longitude, radius, limit = data['lat'], data['lon'], data['radius'], data['limit']
+
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius)
+        candidates = (self.filter_queryset(Store.objects.all())
+                      .filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+                      .values_list('id', 'latitude', 'longitude'))
+        nearest = sorted(item for item in haversine_many(latitude, longitude, candidates) if item[0] <= radius)
+        nearest = nearest[:limit]
+
+        stores = self.get_queryset().in_bulk([store_id for _, store_id in nearest])
+        result = []
+        for distance, store_id in nearest:
+            store = stores[store_id]
+            store.distance = distance
+            result.append(store)
+        return Response(self.get_serializer(result, many=True).data)
+
+
+class SearchApiView(generics.GenericAPIView):
+    max_limit = 50
+
+    def get(self, request, *args, **kwargs):
+        kind = request.query_params.get('kind')
+        if kind not in (None, 'store', 'product', 'combo'):
+            return Response({'detail': 'kind must be store, product or combo'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), self.max_limit)
+        except ValueError:
+            return Response({'detail': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        language = translation.get_language()
+        results = []
+        for item in search(request.query_params.get('q', ''), kind=kind, limit=limit):
+            name_en, name_ru = item.pop('name_en'), item.pop('name_ru')
+            item['name'] = (name_ru or name_en) if language == 'ru' else (name_en or name_ru)
+            results.append(item)
+        return Response(results)
+
+
+class StoreDetailApiView(CatalogueCacheMixin, PrefetchPlanMixin, generics.RetrieveAPIView):
     queryset = Store.objects.all()
     serializer_class = StoreDetailSerializer
     permission_classes = [CheckCourier]
 
 
+class ExportApiView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, kind, fmt):
+        if kind not in EXPORTS or fmt not in FORMATS:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        export = export_queryset(kind, request.user)
+        if export is None:
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        return stream_export(request._request, kind, *export, fmt)
+
+
+class StoreAnalyticsApiView(generics.GenericAPIView):
+    queryset = Store.objects.only('id', 'owner_id')
+    permission_classes = [permissions.IsAuthenticated, CheckCreateStore]
+    max_days = 365
+
+    def get(self, request, *args, **kwargs):
+        store = self.get_object()
+        if store.owner_id != request.user.pk:
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        try:
+            days = min(max(int(request.query_params.get('days', 90)), 1), self.max_days)
+        except ValueError:
+            return Response({'detail': 'days must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_daily_stats(store.pk, days))
+
+
 class StoreCreateApiView(generics.CreateAPIView):
     serializer_class = StoreCreateSerializer
     permission_classes = [CheckCreateStore]
 
 
-class StoreUpdateDeleteApiView(generics.RetrieveUpdateDestroyAPIView):
+class StoreUpdateDeleteApiView(PrefetchPlanMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Store.objects.all()
     serializer_class = StoreCreateSerializer
     permission_classes = [CheckCreateStore, CheckOwnerStore]
 
 
-class StoreReviewViewSet(viewsets.ModelViewSet):
+class StoreReviewViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = StoreReview.objects.all()
     serializer_class = StoreReviewSerializer
+    pagination_class = CreatedDateCursorPagination
     permission_classes = [CheckReview]
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
 
-class ProductComboViewSet(viewsets.ModelViewSet):
+class ProductComboViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = ProductCombo.objects.all()
     serializer_class = ProductComboSerializer
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+# no create: orders are only made by CheckoutApiView
+class OrderViewSet(PrefetchPlanMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.UpdateModelMixin,
+                   mixins.DestroyModelMixin, viewsets.GenericViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
-    permission_classes = [CheckOrder, CheckOrderUser]
+    pagination_class = CreatedDateCursorPagination
+    permission_classes = [permissions.IsAuthenticated, CheckOrder, CheckOrderUser]
+
+    def get_serializer_class(self):
+        user = self.request.user
+        if (self.serializer_class is OrderSerializer and not user.is_staff
+                and getattr(user, 'user_role', None) == 'владелец'):
+            return OwnerOrderSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        user = self.request.user
+        if not user.is_staff and user.user_role == 'владелец':
+            queryset = Order.objects.filter(pk__in=OrderItem.objects.filter(store__owner=user).values('order_id'))
+            if self.get_serializer_class() is OwnerOrderSerializer:
+                queryset = prefetch_owner_items(queryset, user)
+            return queryset
+        queryset = super().get_queryset()
+        if user.is_staff:
+            return queryset
+        if user.user_role == 'курьер':
+            return queryset.filter(courier=user)
+        return queryset.filter(client=user)
+
+    @action(detail=True, methods=['post'], serializer_class=OrderTransitionSerializer)
+    def transition(self, request, *args, **kwargs):
+        order = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        expected_status = serializer.validated_data.get('expected_status', order.status)
+        new_status = serializer.validated_data['status']
+        try:
+            check_actor(request.user, order, expected_status, new_status)
+            transition_order(order.pk, expected_status, new_status, actor=request.user)
+        except TransitionForbidden as e:
+            return Response({'detail': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except TransitionConflict as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        except TransitionError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        order.refresh_from_db()
+        return Response(OrderSerializer(order, context=self.get_serializer_context()).data)
+
+    @action(detail=True, methods=['get'], pagination_class=None)
+    def events(self, request, *args, **kwargs):
+        order = self.get_object()
+        events = order.events.select_related('actor').order_by('created_date', 'id')
+        return Response(OrderEventSerializer(events, many=True).data)
+
+
+class CheckoutApiView(generics.GenericAPIView):
+    serializer_class = CheckoutSerializer
+    permission_classes = [permissions.IsAuthenticated, CheckOrder]
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            order = checkout(request.user, serializer.validated_data['delivery_address'])
+        except CheckoutConflict as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        except CheckoutError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
 
-class ContactInfoViewSet(viewsets.ModelViewSet):
+
+class ContactInfoViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = ContactInfo.objects.all()
     serializer_class = ContactInfoSerializer
 
 
-class CourierViewSet(viewsets.ModelViewSet):
+class CourierViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Courier.objects.all()
     serializer_class = CourierSerializer
-
-
-class CourierReviewViewSet(viewsets.ModelViewSet):
+    permission_classes = [CheckCourierAccess]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_staff:
+            return queryset
+        return queryset.filter(Q(user=user) | Q(current_orders__client=user))
+
+    @action(detail=False, methods=['post'], url_path='location', serializer_class=LocationBatchSerializer,
+            permission_classes=[CheckCourierRole])
+    def post_location(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        courier_id = Courier.objects.filter(user=request.user).values_list('id', flat=True).first()
+        if courier_id is None:
+            return Response({'detail': 'Курьер не найден'}, status=status.HTTP_404_NOT_FOUND)
+        flush = False
+        for point in serializer.validated_data['points']:
+            flush = ingestor.record(courier_id, point['latitude'], point['longitude'], point.get('timestamp'))
+        if flush:
+            ingestor.flush()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['get'], pagination_class=None, permission_classes=[permissions.AllowAny])
+    def leaderboard(self, request, *args, **kwargs):
+        query = LeaderboardQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(get_leaderboard(query.validated_data['limit']))
+
+    @action(detail=True, methods=['get'], url_path='location')
+    def get_location(self, request, *args, **kwargs):
+        position = ingestor.latest(self.get_object().pk)
+        if position is None:
+            return Response({'detail': 'Нет данных'}, status=status.HTTP_404_NOT_FOUND)
+        latitude, longitude, timestamp = position
+        return Response({'latitude': latitude, 'longitude': longitude, 'timestamp': timestamp})
+
+
+class CourierReviewViewSet(FastListMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = CourierReview.objects.all()
     serializer_class = CourierReviewSerializer
+    fast_serializer = fast_courier_review
+    pagination_class = CreatedDateCursorPagination
 
 
-class CartViewSet(viewsets.ModelViewSet):
+class CartViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
 
+    def get_queryset(self):
+        return super().get_queryset().annotate(
+            total_price=Coalesce(Sum(F('items__quantity') * F('items__product__price')), 0))
+
+    @action(detail=False, methods=['post'], serializer_class=CartBulkSerializer,
+            permission_classes=[permissions.IsAuthenticated])
+    def bulk(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            cart = apply_cart_operations(request.user, serializer.validated_data['operations'])
+        except CartError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        cart = plan_queryset(self.get_queryset(), CartSerializer).get(pk=cart.pk)
+        return Response(CartSerializer(cart, context=self.get_serializer_context()).data)
+
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = CarItem.objects.all()
     serializer_class = CartItemSerializer
 
 
+class MessageHistoryApiView(PrefetchPlanMixin, generics.ListAPIView):
+    queryset = Message.objects.all()
+    serializer_class = MessageSerializer
+    pagination_class = MessageCursorPagination
+    permission_classes = [CheckChatMember]
 
+    def get_queryset(self):
+        return super().get_queryset().filter(chat_id=self.kwargs['chat_id'])
+
+
+class ChatUploadCreateApiView(generics.GenericAPIView):
+    serializer_class = ChunkedUploadCreateSerializer
+    permission_classes = [CheckChatMember]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            upload = start_upload(request.user, self.kwargs['chat_id'], **serializer.validated_data)
+        except UploadError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ChunkedUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+
+class ChatUploadApiView(PrefetchPlanMixin, generics.RetrieveDestroyAPIView):
+    """
+    GET reports how many bytes arrived, so a client can resume from there.
+    PATCH sends the next chunk as the raw request body, with its position
+    in the Upload-Offset header. The chunk that completes the file returns
+    201 with the new message.
+    """
+    queryset = ChunkedUpload.objects.all()
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return super().get_queryset().filter(author=self.request.user)
+
+    def patch(self, request, *args, **kwargs):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            return Response({'detail': 'Нужен заголовок Upload-Offset'}, status=status.HTTP_400_BAD_REQUEST)
+        if length > getattr(settings, 'CHAT_UPLOAD_MAX_CHUNK', 16 * 1024 * 1024):
+            return Response({'detail': 'Слишком большой фрагмент'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        try:
+            write_chunk(upload, offset, request.stream or io.BytesIO(), length)
+        except UploadConflict as e:
+            return Response({'detail': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT)
+        except UploadError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        code = status.HTTP_201_CREATED if upload.message_id else status.HTTP_200_OK
+        return Response(self.get_serializer(upload).data, status=code)
+
+    def perform_destroy(self, instance):
+        discard_upload(instance)
 